@@ -1,8 +1,9 @@
 """Async batch code fetcher."""
 import asyncio
+import json
 import aiohttp
 from typing import List, Dict, Optional
-from scanner.config import RPCS, BATCH_SIZE, ASYNC_CONCURRENT
+from scanner.config import RPCS, BATCH_SIZE, ASYNC_CONCURRENT, ASYNC_DEBUG, ASYNC_BLOCK_THRESHOLD_MS
 
 logger = None
 
@@ -16,6 +17,20 @@ def _get_logger():
     return logger
 
 
+def _enable_block_monitor(loop: asyncio.AbstractEventLoop) -> None:
+    """
+    Surface synchronous work that stalls the loop (development only).
+
+    With ASYNC_DEBUG set, uses asyncio debug mode: any callback running
+    longer than ASYNC_BLOCK_THRESHOLD_MS is logged by the "asyncio" logger
+    with the offending handle, so the call site can be moved to an executor.
+    """
+    if not ASYNC_DEBUG or ASYNC_BLOCK_THRESHOLD_MS <= 0 or loop.get_debug():
+        return
+    loop.set_debug(True)
+    loop.slow_callback_duration = ASYNC_BLOCK_THRESHOLD_MS / 1000.0
+
+
 async def fetch_code_batch(
     addresses: List[str],
     rpc_url: str,
@@ -52,12 +67,15 @@ async def fetch_code_batch(
             timeout=aiohttp.ClientTimeout(total=30)
         ) as response:
             if response.status != 200:
-                _get_logger().error(
-                    f"RPC error {response.status} for {rpc_url}"
-                )
+                _get_logger().error(f"RPC error {response.status} for {rpc_url}")
                 return {addr: None for addr in addresses}
 
-            data = await response.json()
+            # Batch bodies carry whole bytecodes (often >1 MB); decode
+            # off-loop so other in-flight requests keep being serviced.
+            raw = await response.read()
+            data = await asyncio.get_running_loop().run_in_executor(
+                None, json.loads, raw
+            )
             results = {}
 
             # Handle both single response and batch response
@@ -103,6 +121,8 @@ async def fetch_codes_async(
     if not addresses:
         return {}
 
+    _enable_block_monitor(asyncio.get_running_loop())
+
     # Split into batches
     batches = [
         addresses[i:i + BATCH_SIZE]
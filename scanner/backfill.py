@@ -6,6 +6,7 @@ import logging
 from typing import Optional, List
 from web3 import Web3
 from scanner.contract_queue import enqueue, enqueue_priority
+from scanner.web3_pool import get_shared_w3
 
 # Suppress eth_utils network warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="eth_utils")
@@ -41,7 +42,7 @@ def run_backfill(
         include_factories: Whether to scan factory contracts
         include_verified: Whether to ingest verified contracts
     """
-    w3 = Web3(Web3.HTTPProvider(RPCS[0]))
+    w3 = get_shared_w3(RPCS[0])
     current_block = w3.eth.block_number
     
     if start_block is None:
@@ -1,7 +1,9 @@
 """Block watcher for new contract deployments."""
 import time
+import atexit
 import logging
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Any
 from web3 import Web3, AsyncWeb3
 try:
@@ -10,7 +12,8 @@ except Exception:
     from web3.providers.async_rpc import AsyncHTTPProvider
     AsyncWebsocketProvider = None
 from scanner.contract_queue import enqueue, enqueue_priority
-from scanner.config import RPCS, RPCS_WS, USE_WS, MAX_LOG_RANGE_BLOCKS, BLOCK_LAG as CONFIG_BLOCK_LAG, LARGE_TRANSFER_THRESHOLD_WEI
+from scanner.web3_pool import get_shared_w3
+from scanner.config import RPCS, RPCS_WS, USE_WS, MAX_LOG_RANGE_BLOCKS, BLOCK_LAG as CONFIG_BLOCK_LAG, LARGE_TRANSFER_THRESHOLD_WEI, SIM_MAX_WORKERS
 from scanner.watchlist_manager import load_watchlist
 from scanner.worker import process_contract
 from scanner.sniper import snipe_inflation_attack
@@ -26,6 +29,11 @@ BLOCK_BATCH_SIZE: int = min(3, MAX_LOG_RANGE_BLOCKS)  # Fetch multiple blocks at
 
 logger = logging.getLogger(__name__)
 
+# Sniper/worker jobs spawn forge; keep them off the loop's default executor so they
+# cannot starve other run_in_executor users, and bound how many run at once
+_SNIPE_EXECUTOR = ThreadPoolExecutor(max_workers=max(1, SIM_MAX_WORKERS), thread_name_prefix="sniper")
+atexit.register(_SNIPE_EXECUTOR.shutdown, wait=False)
+
 
 def watch(w3: Web3) -> None:
     """
@@ -192,7 +200,7 @@ async def _watch_async() -> None:
                                     # SNIPER: Instant First Deposit Check
                                     try:
                                         loop = asyncio.get_running_loop()
-                                        loop.run_in_executor(None, snipe_inflation_attack, Web3(Web3.HTTPProvider(RPCS[0])), vault)
+                                        loop.run_in_executor(_SNIPE_EXECUTOR, snipe_inflation_attack, get_shared_w3(RPCS[0]), vault)
                                     except Exception as e:
                                         logger.error(f"[SNIPER] Failed to trigger inflation sniper: {e}")
                                     continue
@@ -223,7 +231,7 @@ async def _watch_async() -> None:
                                         logger.warning(f"[SNIPER] Watchlist target {receiver} received funds! Triggering exploit...")
                                         try:
                                             loop = asyncio.get_running_loop()
-                                            loop.run_in_executor(None, process_contract, Web3(Web3.HTTPProvider(RPCS[0])), receiver)
+                                            loop.run_in_executor(_SNIPE_EXECUTOR, process_contract, get_shared_w3(RPCS[0]), receiver)
                                         except Exception as e:
                                             logger.error(f"[SNIPER] Failed to trigger worker: {e}")
 
@@ -310,8 +318,7 @@ def _watch_sync(w3: Web3) -> None:
         last_block: int = w3.eth.block_number
     except Exception:
         try:
-            from scanner.config import RPCS
-            w3 = Web3(Web3.HTTPProvider(RPCS[0]))
+            w3 = get_shared_w3(RPCS[0])
             last_block = w3.eth.block_number
         except Exception:
             time.sleep(5)
@@ -432,10 +439,9 @@ def _watch_sync(w3: Web3) -> None:
             logger.error(f"Watcher error {e}")
             msg = str(e)
             try:
-                from scanner.config import RPCS
                 for endpoint in RPCS:
                     try:
-                        w3 = Web3(Web3.HTTPProvider(endpoint))
+                        w3 = get_shared_w3(endpoint)
                         _ = w3.eth.block_number
                         break
                     except Exception:
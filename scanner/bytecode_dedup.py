@@ -3,25 +3,34 @@ import hashlib
 import threading
 from typing import Set, Optional
 
-_BYTECODE_HASHES: Set[str] = set()
+try:
+    import xxhash
+except Exception:
+    xxhash = None
+
+# The dedup table is a process-local set, not an on-chain artefact, so a fast
+# non-cryptographic 128-bit digest is enough. blake2b is the stdlib fallback.
+_BYTECODE_HASHES: Set[bytes] = set()
 _LOCK: threading.Lock = threading.Lock()
 
 
-def get_bytecode_hash(bytecode: str) -> str:
+def get_bytecode_hash(bytecode: str) -> bytes:
     """
-    Calculate SHA256 hash of bytecode.
+    Calculate 128-bit dedup digest of bytecode (xxh3 or blake2b).
 
     Args:
         bytecode: Hex string of bytecode
 
     Returns:
-        Hex string of hash
+        16-byte digest
     """
     if bytecode.startswith("0x"):
         bytecode = bytecode[2:]
     
     byte_data = bytes.fromhex(bytecode)
-    return hashlib.sha256(byte_data).hexdigest()
+    if xxhash is not None:
+        return xxhash.xxh3_128_digest(byte_data)
+    return hashlib.blake2b(byte_data, digest_size=16).digest()
 
 
 def is_duplicate(bytecode: str) -> bool:
@@ -69,6 +69,25 @@ FOT_DEEP_DEDUP_TTL_SEC: int = int(os.getenv("FOT_DEEP_DEDUP_TTL_SEC", "900"))
 # Async batch settings
 BATCH_SIZE: int = int(os.getenv("BATCH_SIZE", "50"))  # addresses per batch
 ASYNC_CONCURRENT: int = int(os.getenv("ASYNC_CONCURRENT", "10"))  # concurrent requests
+# Development only: run the fetch loop in asyncio debug mode (adds per-callback overhead)
+ASYNC_DEBUG: bool = os.getenv("ASYNC_DEBUG", "0").lower() in ("1", "true", "yes")
+# With ASYNC_DEBUG, report callbacks that hold the event loop longer than this (0 = off)
+ASYNC_BLOCK_THRESHOLD_MS: float = float(os.getenv("ASYNC_BLOCK_THRESHOLD_MS", "5"))
+
+# Honeypot simulations: fork once through a local anvil instead of per test
+SIM_USE_ANVIL: bool = os.getenv("SIM_USE_ANVIL", "1").lower() in ("1", "true", "yes")
+# Pin simulation forks to a block refreshed this often, so forge's RPC storage cache is reused (0 = latest)
+SIM_FORK_BLOCK_TTL_SEC: float = float(os.getenv("SIM_FORK_BLOCK_TTL_SEC", "300"))
+# Victims simulated concurrently by run_honeypot_simulations_batch, and the cap on
+# concurrent forge processes per scanner process (bounded by RPC rate limits, not cores)
+SIM_MAX_WORKERS: int = int(os.getenv("SIM_MAX_WORKERS", "8"))
+# Kill a forge test run that takes longer than this
+SIM_FORGE_TIMEOUT_SEC: float = float(os.getenv("SIM_FORGE_TIMEOUT_SEC", "300"))
+# Diagnostics: rerun every failed simulation test at -vvvv and keep its call trace in the result output
+SIM_FORGE_TRACE: bool = os.getenv("SIM_FORGE_TRACE", "0").lower() in ("1", "true", "yes")
+# Forge runs per second (and burst) against one RPC endpoint; halved on every 429
+SIM_RPC_RATE: float = float(os.getenv("SIM_RPC_RATE", "10"))
+SIM_RPC_BURST: int = int(os.getenv("SIM_RPC_BURST", "20"))
 
 # Mode: keep only Fee-on-Transfer tests active
 ONLY_FOT_MODE: bool = os.getenv("ONLY_FOT_MODE", "").lower() in ("1", "true", "yes")
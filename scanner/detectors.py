@@ -1,5 +1,6 @@
 from typing import Dict, Any, Optional
 from web3 import Web3
+from scanner.heuristic import has_opcode
 
 def detect_sync_loss(w3: Web3, contract_address: str) -> Dict[str, Any]:
     """
@@ -395,17 +396,19 @@ def detect_self_destruct_reincarnation(w3: Web3, contract_address: str) -> Dict[
     """
     result = {"vulnerable": False, "type": "self_destruct_reincarnation", "details": ""}
     try:
-        code = w3.eth.get_code(contract_address)
+        code = bytes(w3.eth.get_code(contract_address))
         if not code:
             return result
             
-        # 0xf5 is CREATE2, 0xff is SELFDESTRUCT, 0xf4 is DELEGATECALL
-        has_create2 = b'\xf5' in code
-        has_selfdestruct = b'\xff' in code
+        # 0xf5 is CREATE2, 0xff is SELFDESTRUCT, 0xf4 is DELEGATECALL.
+        # Instruction-boundary scan: 0xff/0xf5 inside PUSH data are not opcodes
+        has_selfdestruct = has_opcode(code, 0xFF)
         
         if not has_selfdestruct:
             return result
 
+        has_create2 = has_opcode(code, 0xF5)
+
         # Check for known selectors to ensure it's likely exploitable/public
         # kill, destroy, suicide, close, die, shutdown, harvest
         known_selectors = [
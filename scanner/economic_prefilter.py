@@ -1,12 +1,13 @@
 """Economic-aware static prefilter."""
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from scanner.heuristic import analyze_bytecode
 
 
 def economic_prefilter(
     bytecode: str,
     contract_address: str,
-    min_tvl: int = 10**18  # 1 ETH minimum
+    min_tvl: int = 10**18,  # 1 ETH minimum
+    signals: Optional[Dict[str, int]] = None
 ) -> Dict[str, Any]:
     """
     Economic-aware prefilter that considers potential value.
@@ -15,11 +16,13 @@ def economic_prefilter(
         bytecode: Contract bytecode
         contract_address: Contract address
         min_tvl: Minimum TVL threshold
+        signals: Precomputed analyze_bytecode() counts (computed if omitted)
 
     Returns:
         Dictionary with prefilter results
     """
-    signals = analyze_bytecode(bytecode)
+    if signals is None:
+        signals = analyze_bytecode(bytecode)
     
     # Economic signals
     economic_score = 0
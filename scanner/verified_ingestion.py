@@ -1,10 +1,10 @@
 """Verified contracts ingestion and source fetching (Etherscan/BaseScan)."""
 import os
 import time
-import requests
 from typing import List, Set, Optional
 from scanner.contract_queue import enqueue
 from scanner.config import BASESCAN_API_KEY
+from scanner.web3_pool import get_http_session
 
 ETHERSCAN_API_KEY = os.getenv("ETHERSCAN_API_KEY", "")
 
@@ -43,7 +43,7 @@ def fetch_verified_contracts(
         }
         
         try:
-            response = requests.get(url, params=params, timeout=15)
+            response = get_http_session().get(url, params=params, timeout=15)
             data = response.json()
             
             if data.get("status") != "1":
@@ -91,7 +91,7 @@ def fetch_basescan_source(
             "address": address,
             "apikey": api_key
         }
-        resp = requests.get(url, params=params, timeout=15)
+        resp = get_http_session().get(url, params=params, timeout=15)
         data = resp.json()
         if data.get("status") != "1":
             return None
@@ -0,0 +1,125 @@
+"""Shared Web3 instances backed by one pooled HTTP session."""
+import threading
+from typing import Any, Dict, List, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+
+# Keep-alive pool shared by every HTTPProvider, so repeated scans reuse
+# TCP/TLS connections instead of reconnecting per Web3 instance.
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=32, pool_maxsize=64)
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.mount("http://", _ADAPTER)
+
+_REQUEST_TIMEOUT: int = 10
+
+
+def get_http_session() -> requests.Session:
+    """
+    Pooled keep-alive session shared with the Web3 providers.
+
+    Returns:
+        The process-wide requests.Session
+    """
+    return _SESSION
+
+
+_W3_BY_URL: Dict[str, Web3] = {}
+_W3_LOCK = threading.Lock()
+
+
+def get_shared_w3(rpc_url: str) -> Web3:
+    """
+    Cached Web3 for an RPC URL, using the shared HTTP session.
+
+    Args:
+        rpc_url: HTTP(S) RPC endpoint
+
+    Returns:
+        Web3 instance reused for every call with the same URL
+    """
+    w3 = _W3_BY_URL.get(rpc_url)
+    if w3 is not None:
+        return w3
+    with _W3_LOCK:
+        w3 = _W3_BY_URL.get(rpc_url)
+        if w3 is None:
+            w3 = Web3(Web3.HTTPProvider(
+                rpc_url,
+                request_kwargs={"timeout": _REQUEST_TIMEOUT},
+                session=_SESSION,
+            ))
+            _W3_BY_URL[rpc_url] = w3
+        return w3
+
+
+_CHAIN_IDS: Dict[str, int] = {}
+
+
+def get_chain_id(w3: Web3) -> int:
+    """
+    eth_chainId, fetched once per provider endpoint.
+
+    Args:
+        w3: Web3 instance
+
+    Returns:
+        Chain id of the endpoint behind w3
+    """
+    endpoint = str(getattr(w3.provider, "endpoint_uri", id(w3.provider)))
+    cid = _CHAIN_IDS.get(endpoint)
+    if cid is None:
+        cid = int(w3.eth.chain_id)
+        _CHAIN_IDS[endpoint] = cid
+    return cid
+
+
+# EIP-55 results keyed by lowercase address; the set of addresses in flight
+# is small compared to how often the same ones are re-checksummed.
+_CHECKSUM_CACHE: Dict[str, str] = {}
+_CHECKSUM_CACHE_MAX: int = 100_000
+
+
+def checksum_address(address: str) -> str:
+    """
+    Memoized Web3.to_checksum_address.
+
+    Args:
+        address: Hex address in any case
+
+    Returns:
+        EIP-55 checksummed address
+    """
+    key = address.lower()
+    cached = _CHECKSUM_CACHE.get(key)
+    if cached is not None:
+        return cached
+    checksummed = Web3.to_checksum_address(key)
+    if len(_CHECKSUM_CACHE) >= _CHECKSUM_CACHE_MAX:
+        _CHECKSUM_CACHE.clear()
+    _CHECKSUM_CACHE[key] = checksummed
+    return checksummed
+
+
+def rpc_batch(rpc_url: str, calls: List[Tuple[str, list]], timeout: float = _REQUEST_TIMEOUT) -> List[Any]:
+    """
+    Send several JSON-RPC calls as one batch over the shared session.
+
+    Args:
+        rpc_url: HTTP(S) RPC endpoint
+        calls: (method, params) pairs
+        timeout: Request timeout in seconds
+
+    Returns:
+        The "result" of each call in order (None for errors)
+    """
+    payload = [
+        {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+        for i, (method, params) in enumerate(calls)
+    ]
+    response = _SESSION.post(rpc_url, json=payload, timeout=timeout)
+    response.raise_for_status()
+    by_id = {item.get("id"): item.get("result") for item in response.json()}
+    return [by_id.get(i) for i in range(len(calls))]
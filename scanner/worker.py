@@ -24,6 +24,7 @@ from scanner.impact_severity import score_impact_severity, is_bounty_worthy
 from scanner.idempotent_worker import idempotent_work, is_processed
 from scanner.false_positive_suppression import is_false_positive
 from scanner.verified_ingestion import fetch_basescan_source
+from scanner.web3_pool import get_shared_w3
 from scanner.config import (
     MAX_FEE_PER_GAS,
     MIN_NET_PROFIT_WEI,
@@ -83,7 +84,7 @@ def _write_fot_line(payload: Dict[str, Any]) -> None:
 
 def _run_fot_deep(victim: str) -> None:
     try:
-        w3 = Web3(Web3.HTTPProvider(RPCS[0]))
+        w3 = get_shared_w3(RPCS[0])
         res = probe_fee_on_transfer(w3, victim)
         tok = None
         try:
@@ -241,7 +242,7 @@ def process_contract(w3: Web3, addr: str) -> None:
             
             if not ONLY_FOT_MODE:
                 # Share-asset conversion detection (MOVED TO TOP FOR PRIORITY)
-                conversion = detect_share_asset_conversion(w3, addr)
+                conversion = detect_share_asset_conversion(w3, addr, code)
                 if conversion.get("is_vault_like") and (conversion.get("rounding_detected") or conversion.get("inflation_attack_risk")):
                     findings.append({
                         "type": "share_asset_conversion",
@@ -650,6 +651,6 @@ if __name__ == "__main__":
         sys.exit(1)
 
     target = Web3.to_checksum_address(sys.argv[1])
-    w3_cli = Web3(Web3.HTTPProvider(RPCS[0]))
+    w3_cli = get_shared_w3(RPCS[0])
     print(f"[CLI] Manual analysis for {target} on RPC {RPCS[0]}")
     process_contract(w3_cli, target)
@@ -0,0 +1,123 @@
+"""Tests for the bytecode scans in scanner.heuristic."""
+import random
+
+from scanner.heuristic import (
+    ARITH_OPS,
+    STATE_OPS,
+    analyze_bytecode,
+    dispatcher_selectors,
+    has_opcode,
+    selectors_from_bytecode,
+    strip_metadata,
+    _disassemble,
+)
+
+DELEGATECALL = 0xF4
+SELFDESTRUCT = 0xFF
+
+# a2 64 "ipfs" 58 22 <34-byte hash> 64 "solc" 43 <3-byte version>, then the 2-byte length
+_META = (
+    bytes.fromhex("a2646970667358221220") + bytes([0xF4, 0xFF]) * 16
+    + bytes.fromhex("64736f6c6343000813")
+)
+_META_TAIL = _META + len(_META).to_bytes(2, "big")
+
+
+def _random_code(rng: random.Random, size: int) -> str:
+    return bytes(rng.randrange(256) for _ in range(size)).hex()
+
+
+def test_push_immediates_are_not_opcodes():
+    # PUSH2 0xf4ff; STOP
+    assert not has_opcode("61f4ff00", DELEGATECALL)
+    assert not has_opcode("0x61f4ff00", SELFDESTRUCT)
+    # PUSH1 0x00; DELEGATECALL
+    assert has_opcode("6000f4", DELEGATECALL)
+    # PUSH32 swallowing 32 0xff bytes, then SELFDESTRUCT
+    assert has_opcode("7f" + "ff" * 32 + "ff", SELFDESTRUCT)
+    assert not has_opcode("7f" + "ff" * 32, SELFDESTRUCT)
+
+
+def test_truncated_push_at_end_of_code():
+    assert not has_opcode("63f4", DELEGATECALL)
+    assert analyze_bytecode("63f4")["total_ops"] == len(_disassemble("63f4"))
+
+
+def test_has_opcode_matches_disassembly():
+    rng = random.Random(1234)
+    for _ in range(200):
+        code = _random_code(rng, rng.randrange(1, 200))
+        ops = {name for name, _ in _disassemble(strip_metadata(bytes.fromhex(code)).hex())}
+        assert has_opcode(code, DELEGATECALL) == ("DELEGATECALL" in ops), code
+        assert has_opcode(bytes.fromhex(code), SELFDESTRUCT) == ("SELFDESTRUCT" in ops), code
+
+
+def test_analyze_bytecode_counts_match_disassembly():
+    rng = random.Random(99)
+    for _ in range(200):
+        code = _random_code(rng, rng.randrange(1, 300))
+        ops = [name for name, _ in _disassemble(code)]
+        signals = analyze_bytecode("0x" + code)
+        assert signals["total_ops"] == len(ops), code
+        assert signals["arith"] == sum(name in ARITH_OPS for name in ops), code
+        assert signals["state"] == sum(name in STATE_OPS for name in ops), code
+
+
+def test_strip_metadata_cuts_cbor_tail():
+    code = bytes.fromhex("6000600055")
+    assert strip_metadata(code + _META_TAIL) == code
+
+
+def test_strip_metadata_keeps_code_without_metadata():
+    for code in (b"", b"\x00", bytes.fromhex("6000600055"), bytes.fromhex("6000f40033")):
+        assert strip_metadata(code) == code
+
+
+def test_strip_metadata_needs_a_known_key():
+    # Same shape, but the map's first key is not a compiler metadata key
+    fake = bytes.fromhex("a2646e6f7065") + bytes(10)
+    code = bytes.fromhex("6000") + fake + len(fake).to_bytes(2, "big")
+    assert strip_metadata(code) == code
+
+
+def test_metadata_hash_bytes_are_not_opcodes():
+    code = bytes.fromhex("6000600055") + _META_TAIL
+    assert not has_opcode(code, DELEGATECALL)
+    assert not has_opcode(code.hex(), SELFDESTRUCT)
+    assert has_opcode(bytes.fromhex("6000f4") + _META_TAIL, DELEGATECALL)
+
+
+def _linear(*selectors: str) -> str:
+    # PUSH4 sel DUP2 EQ PUSH2 dest JUMPI, as solc emits for a short dispatcher
+    return "".join(f"63{sel}811461010057" for sel in selectors)
+
+
+def test_dispatcher_linear_chain_is_complete():
+    selectors, complete = dispatcher_selectors("0x" + _linear("b6b55f25", "2e1a7d4d"))
+    assert selectors == {"0xb6b55f25", "0x2e1a7d4d"}
+    assert complete
+
+
+def test_dispatcher_binary_search_is_incomplete():
+    # PUSH4 pivot GT splits the table; the selectors past the pivot may be missed
+    code = "63700000008111" + _linear("b6b55f25")
+    selectors, complete = dispatcher_selectors(code)
+    assert "0xb6b55f25" in selectors
+    assert not complete
+
+
+def test_dispatcher_push3_selector_is_incomplete():
+    # A selector with a leading zero byte is pushed as PUSH3
+    code = _linear("b6b55f25") + "62abcdef14"
+    selectors, complete = dispatcher_selectors(code)
+    assert selectors == {"0xb6b55f25"}
+    assert not complete
+
+
+def test_dispatcher_without_selectors_is_incomplete():
+    assert dispatcher_selectors("6000600055") == (set(), False)
+
+
+def test_selectors_from_bytecode_matches_dispatcher_scan():
+    code = "63700000008111" + _linear("b6b55f25")
+    assert selectors_from_bytecode(code) == dispatcher_selectors(code)[0]
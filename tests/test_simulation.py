@@ -0,0 +1,225 @@
+"""Tests for the forge-output parsing and test-generation helpers in scanner.simulation."""
+import pytest
+
+pytest.importorskip("web3")
+pytest.importorskip("eth_abi")
+pytest.importorskip("requests")
+
+from scanner import simulation  # noqa: E402
+
+DEPOSIT = "0xb6b55f25"    # deposit(uint256)
+MINT = "0xa0712d68"       # mint(uint256)
+STAKE = "0xa694fc3a"      # stake(uint256)
+
+_LADDER = (
+    "        (ok, ) = victim.call(abi.encodeWithSelector(bytes4(0xd0e30db0)));\n"
+    f"        if (!ok) (ok, ) = victim.call(abi.encodeWithSelector(bytes4({DEPOSIT}), amount));\n"
+    f"        if (!ok) (ok, ) = victim.call(abi.encodeWithSelector(bytes4({MINT}), amount)); // mint\n"
+    f"        if (!ok) (ok, ) = victim.call(abi.encodeWithSelector(bytes4({STAKE}), amount));\n"
+)
+
+
+def _dispatcher(*selectors: str) -> bytes:
+    # PUSH4 sel DUP2 EQ PUSH2 dest JUMPI per selector
+    return bytes.fromhex("".join(f"63{sel[2:]}811461010057" for sel in selectors))
+
+
+@pytest.fixture
+def victim_code(monkeypatch):
+    """Serve the given runtime code to _victim_selectors without an RPC."""
+    def _serve(code: bytes) -> None:
+        simulation._DISPATCH_CACHE.clear()
+        monkeypatch.setattr(simulation, "get_chain_id", lambda w3: 1)
+        monkeypatch.setattr(simulation, "_get_code", lambda w3, address: code)
+    yield _serve
+    simulation._DISPATCH_CACHE.clear()
+
+
+def test_ladder_pruned_after_complete_scan(victim_code):
+    victim_code(_dispatcher(DEPOSIT, STAKE))
+    selectors = simulation._victim_selectors(object(), "0x00000000000000000000000000000000000000aa")
+    assert selectors == {DEPOSIT, STAKE}
+
+    pruned = simulation._prune_selector_ladders(_LADDER, selectors)
+    assert DEPOSIT in pruned and STAKE in pruned
+    assert MINT not in pruned
+    # The first call of a ladder is never a rung and always stays
+    assert "bytes4(0xd0e30db0)" in pruned
+
+
+def test_ladder_kept_after_incomplete_scan(victim_code):
+    # A PUSH4 pivot compared with GT marks a binary-search dispatcher
+    victim_code(bytes.fromhex("63700000008111") + _dispatcher(DEPOSIT))
+    selectors = simulation._victim_selectors(object(), "0x00000000000000000000000000000000000000bb")
+    assert selectors == frozenset()
+    assert simulation._prune_selector_ladders(_LADDER, selectors) == _LADDER
+
+
+def test_ladder_kept_for_proxies(victim_code):
+    victim_code(_dispatcher(DEPOSIT) + bytes.fromhex("6000f4"))
+    assert simulation._victim_selectors(object(), "0x00000000000000000000000000000000000000cc") == frozenset()
+
+
+def test_same_shaped_rungs_fold_into_a_selector_loop():
+    folded = simulation._loop_selector_ladders(_LADDER.replace(" // mint", ""))
+    assert "victim.call(abi.encodeWithSelector(bytes4(0xd0e30db0)));" in folded
+    assert f"bytes4[3] memory _sels = [bytes4({DEPOSIT}), bytes4({MINT}), bytes4({STAKE})];" in folded
+    assert "for (uint256 _k = 0; _k < 3 && !ok; _k++) (ok, ) = victim.call(abi.encodeWithSelector(_sels[_k], amount));" in folded
+    assert folded.count("victim.call(") == 2
+
+
+def test_short_or_mixed_runs_are_left_alone():
+    # The commented mint rung splits the run into single rungs, below _LOOP_MIN_RUNGS
+    assert simulation._loop_selector_ladders(_LADDER) == _LADDER
+
+
+# Trimmed `forge test --json` report of an ETH run (compiler chatter precedes the JSON)
+_FORGE_JSON = """Compiling 1 files with Solc 0.8.20
+Compiler run successful!
+{"test/Honeypot_ab12.t.sol:HoneypotTest":{"duration":"1s 2ms","test_results":{
+"testSafeCycleETH_1_eth()":{"status":"Success","reason":null,"counterexample":null,"logs":[],
+ "decoded_logs":["SUCCESS_METHOD: withdraw()","START_BAL: 1000000000000000000","FINAL_BAL: 1250000000000000000"],
+ "kind":{"Unit":{"gas":81234}},"traces":[],"labeled_addresses":{},"duration":{"secs":0,"nanos":1}},
+"testSafeCycleETH_10_eth()":{"status":"Failure","reason":"revert: Deposit failed","counterexample":null,"logs":[],
+ "decoded_logs":[],"kind":{"Unit":{"gas":51200}},"traces":[],"labeled_addresses":{},"duration":{"secs":0,"nanos":1}},
+"testRoundingDrift()":{"status":"Success","reason":null,"counterexample":null,"logs":[],
+ "decoded_logs":["SUCCESS_METHOD: rounding_drift","PROFIT_WEI: 1"],
+ "kind":{"Unit":{"gas":40100}},"traces":[],"labeled_addresses":{},"duration":{"secs":0,"nanos":1}},
+"testRoundingDustExploit()":{"status":"Success","reason":null,"counterexample":null,"logs":[],
+ "decoded_logs":["SUCCESS_METHOD: deep_search","SELECTOR:","0x3ccfd60b","START_BAL: 900","FINAL_BAL: 800"],
+ "kind":{"Unit":{"gas":90000}},"traces":[],"labeled_addresses":{},"duration":{"secs":0,"nanos":1}}
+},"warnings":[]}}
+"""
+_LABELS = {"testSafeCycleETH_1_eth()": "1_eth", "testSafeCycleETH_10_eth()": "10_eth"}
+
+
+def test_forge_json_report_splits_per_scenario():
+    report = simulation._load_forge_json(_FORGE_JSON)
+    assert report is not None
+    results = simulation._parse_forge_json_scenarios(report, "", _LABELS)
+    assert set(results) == {"1_eth", "10_eth", simulation._SHARED_LABEL}
+
+    assert results["1_eth"]["safe"]
+    assert results["1_eth"]["method"] == "withdraw()"
+    assert results["1_eth"]["simulated_profit"] == 250000000000000000
+
+    assert not results["10_eth"]["safe"]
+    assert results["10_eth"]["error"] == "Simulation Reverted: revert: Deposit failed"
+    assert results["10_eth"]["simulated_profit"] == 0
+
+
+def test_forge_json_profit_is_read_per_test():
+    results = simulation._parse_forge_json_scenarios(simulation._load_forge_json(_FORGE_JSON), "", _LABELS)
+    shared = results[simulation._SHARED_LABEL]
+    # The drift flag belongs to its own test; a balance drop is floored at zero
+    assert shared["safe"]
+    assert shared["method"] == "rounding_drift"
+    assert shared["simulated_profit"] == 1
+    assert simulation._json_test_outcome({
+        "decoded_logs": ["SUCCESS_METHOD: deep_search", "SELECTOR:", "0x3ccfd60b", "START_BAL: 900", "FINAL_BAL: 800"],
+    }) == ("deep_search_0x3ccfd60b", 0)
+
+
+def test_non_json_output_is_not_a_report():
+    assert simulation._load_forge_json("Error: Compiler run failed") is None
+    assert simulation._load_forge_json("[1, 2]") is None
+
+
+def test_text_fallback_reads_balances():
+    stdout = (
+        "[PASS] testSafeCycleETH() (gas: 81234)\n"
+        "Logs:\n  SUCCESS_METHOD: exit()\n  START_BAL: 100\n  FINAL_BAL: 175\n"
+    )
+    result = simulation._parse_forge_output(stdout, "")
+    assert result["safe"] and result["method"] == "exit()" and result["simulated_profit"] == 75
+
+
+class _Clock:
+    """Stands in for the time module inside scanner.simulation; sleeping advances it."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _Clock()
+    monkeypatch.setattr(simulation, "time", fake)
+    monkeypatch.setattr(simulation, "_RPC_JITTER_SEC", 0.0)
+    return fake
+
+
+def test_bucket_refills_at_its_rate(clock):
+    bucket = simulation._RpcBucket(rate=2.0, burst=2)
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.slept == []
+
+    bucket.acquire()
+    assert clock.slept == [pytest.approx(0.5)]
+    assert not bucket.try_acquire()
+
+    clock.now += 10
+    # Idle time refills up to the burst, not beyond
+    assert bucket.try_acquire() and bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_bucket_backs_off_exponentially(clock, monkeypatch):
+    monkeypatch.setattr(simulation, "SIM_RPC_RATE", 4.0)
+    bucket = simulation._RpcBucket(rate=4.0, burst=4)
+
+    assert bucket.throttled() == pytest.approx(simulation._RPC_BACKOFF_BASE_SEC)
+    assert bucket.rate == pytest.approx(2.0)
+    assert bucket.throttled() == pytest.approx(2 * simulation._RPC_BACKOFF_BASE_SEC)
+    assert bucket.rate == pytest.approx(1.0)
+    assert not bucket.try_acquire()
+
+    # Blocked until the hold ends; the hold itself refills one token at the halved rate
+    bucket.acquire()
+    assert sum(clock.slept) == pytest.approx(2 * simulation._RPC_BACKOFF_BASE_SEC)
+    bucket.acquire()
+    assert clock.slept[-1] == pytest.approx(1.0)
+
+    bucket.succeeded()
+    assert bucket.rate == pytest.approx(1.0 + simulation._RPC_RATE_STEP)
+    assert bucket.strikes == 0
+    for _ in range(10):
+        bucket.succeeded()
+    assert bucket.rate == pytest.approx(4.0)
+
+
+def test_bucket_honours_retry_after_up_to_the_cap(clock):
+    bucket = simulation._RpcBucket(rate=1.0, burst=1)
+    assert bucket.throttled(retry_after=7) == pytest.approx(7.0)
+    assert bucket.blocked_until == pytest.approx(clock.now + 7.0)
+    assert bucket.throttled(retry_after=3600) == pytest.approx(simulation._RPC_BACKOFF_MAX_SEC)
+    for _ in range(5):
+        bucket.throttled()
+    assert bucket.rate == pytest.approx(simulation._RPC_RATE_MIN)
+
+
+def test_paced_run_throttles_its_endpoint_on_429(clock, monkeypatch):
+    endpoint = "http://rpc.test/paced"
+    simulation._RPC_BUCKETS.pop(endpoint, None)
+    monkeypatch.setattr(simulation, "_run_forge_files", lambda content, labels, env: {
+        "1_eth": {"safe": False, "error": "HTTP error 429 Too Many Requests, retry-after: 4"},
+    })
+    try:
+        simulation._run_forge_paced("", {}, {"SIM_RPC_URL": endpoint})
+        bucket = simulation._RPC_BUCKETS[endpoint]
+        assert bucket.strikes == 1
+        assert bucket.blocked_until == pytest.approx(clock.now + 4.0)
+    finally:
+        simulation._RPC_BUCKETS.pop(endpoint, None)